@@ -0,0 +1,426 @@
+
+import os
+import sys
+import json
+import time
+import fcntl
+import signal
+import socket
+import struct
+import hashlib
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+# the daemon exits after this many seconds without requests
+_IDLE_TIMEOUT = 30 * 60
+_START_TIMEOUT = 10
+_MAX_MSG_SIZE = 1024 * 1024
+
+
+def socket_path(workspace: str) -> str:
+    """
+    Path of the Unix socket of the daemon that serves [workspace]. There is
+    one daemon per workspace and user.
+    """
+    _runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+
+    if _runtime_dir is None:
+        import tempfile
+        _runtime_dir = tempfile.gettempdir()
+
+    _hash = hashlib.sha256(os.path.realpath(workspace).encode()).hexdigest()
+
+    return os.path.join(
+        _runtime_dir,
+        f"torizon-tasks-{os.getuid()}-{_hash[:16]}.sock"
+    )
+
+
+def _send_msg(
+        sock: socket.socket, msg: Dict, fds: Optional[List[int]] = None
+    ) -> None:
+    _data = (json.dumps(msg) + "\n").encode()
+
+    if fds:
+        socket.send_fds(sock, [_data], fds)
+    else:
+        sock.sendall(_data)
+
+
+class _MsgReader:
+    """
+    Reads the newline delimited json messages of the connection.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.__sock = sock
+        self.__buffer = b""
+
+
+    def read(self, max_fds: int = 0) -> Tuple[Optional[Dict], List[int]]:
+        _fds: List[int] = []
+
+        while b"\n" not in self.__buffer:
+            if len(self.__buffer) > _MAX_MSG_SIZE:
+                raise ValueError("Daemon message too big")
+
+            if max_fds > 0:
+                _data, _fds, _, _ = socket.recv_fds(self.__sock, 65536, max_fds)
+                max_fds = 0
+            else:
+                _data = self.__sock.recv(65536)
+
+            if not _data:
+                return None, _fds
+
+            self.__buffer += _data
+
+        _line, self.__buffer = self.__buffer.split(b"\n", 1)
+
+        return json.loads(_line), _fds
+
+
+# ----------------------------------------------------------------- CLIENT
+
+
+def _connect(path: str) -> Optional[socket.socket]:
+    _sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        _sock.connect(path)
+        return _sock
+    except OSError:
+        _sock.close()
+        return None
+
+
+def _spawn(workspace: str) -> None:
+    # -u so the output of the daemon requests is not buffered, the task
+    # messages need to be in order with the output of the tasks
+    subprocess.Popen(
+        [
+            sys.executable, "-u", "-m",
+            "torizon_templates_utils.daemon", workspace
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        cwd=workspace
+    )
+
+
+def run_task(
+        workspace: str,
+        label: str,
+        settings_file: str,
+        force: bool = False,
+        profile: bool = False
+    ) -> Optional[int]:
+    """
+    Ask the daemon of [workspace] to run the task [label], starting the
+    daemon if it is not running. The stdin, stdout and stderr of this
+    process are passed to the daemon, so the output of the tasks goes to
+    the same terminal. Returns None if the daemon could not be used, so the
+    caller can run the task itself. Errors of the task are raised here with
+    the same type they were raised on the daemon.
+    """
+    if not hasattr(socket, "send_fds"):
+        return None
+
+    _path = socket_path(workspace)
+    _sock = _connect(_path)
+
+    if _sock is None:
+        _spawn(workspace)
+        _deadline = time.monotonic() + _START_TIMEOUT
+
+        while _sock is None and time.monotonic() < _deadline:
+            time.sleep(0.05)
+            _sock = _connect(_path)
+
+        if _sock is None:
+            return None
+
+    with _sock:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        _send_msg(_sock, {
+            "cmd": "run",
+            "label": label,
+            "settings": settings_file,
+            "force": force,
+            "profile": profile,
+            "environ": dict(os.environ),
+            "cwd": os.getcwd()
+        }, [0, 1, 2])
+
+        _reader = _MsgReader(_sock)
+        _pid: Optional[int] = None
+
+        while True:
+            try:
+                _msg, _ = _reader.read()
+            except KeyboardInterrupt:
+                # the tasks are not on our process group, so forward the
+                # ctrl+c to them and wait for the result
+                if _pid is not None:
+                    os.killpg(_pid, signal.SIGINT)
+                continue
+
+            if _msg is None:
+                raise RuntimeError("Task daemon closed the connection")
+
+            if "pid" in _msg:
+                _pid = _msg["pid"]
+                continue
+
+            if "error" in _msg:
+                if _msg["error_type"] == "ReferenceError":
+                    raise ReferenceError(_msg["error"])
+                elif _msg["error_type"] == "ValueError":
+                    raise ValueError(_msg["error"])
+                else:
+                    raise RuntimeError(_msg["error"])
+
+            return _msg["code"]
+
+
+def stop(workspace: str) -> bool:
+    """
+    Stop the daemon of [workspace]. Returns False if it was not running.
+    """
+    _sock = _connect(socket_path(workspace))
+
+    if _sock is None:
+        return False
+
+    with _sock:
+        _send_msg(_sock, { "cmd": "stop" })
+        _MsgReader(_sock).read()
+
+    return True
+
+
+# ----------------------------------------------------------------- SERVER
+
+
+class TaskDaemon:
+    """
+    TaskDaemon keeps the parsed tasks.json and settings.json of a workspace
+    in memory and serves run requests on a Unix socket. Each request is
+    forked from the daemon, so it starts with the warm imports and the
+    parsed models, and runs with the environment, cwd and stdio of the
+    client. The models are reloaded when the json files change.
+    """
+
+    def __init__(self, workspace: str):
+        self.__workspace = os.path.realpath(workspace)
+        self.__path = socket_path(self.__workspace)
+        self.__idle_timeout = int(
+            os.environ.get("TASKS_DAEMON_IDLE_TIMEOUT", _IDLE_TIMEOUT)
+        )
+        # settings file -> (stamps, tasks, settings)
+        self.__models: Dict[str, Tuple] = {}
+        self.__children: List[int] = []
+
+
+    def __stamp(self, file: str) -> Tuple[int, int]:
+        try:
+            _stat = os.stat(os.path.join(self.__workspace, ".vscode", file))
+            return (_stat.st_mtime_ns, _stat.st_size)
+        except FileNotFoundError:
+            return (0, 0)
+
+
+    def __load(self, settings_file: str) -> Tuple:
+        from torizon_templates_utils import tasks
+
+        _stamps = (self.__stamp("tasks.json"), self.__stamp(settings_file))
+        _cached = self.__models.get(settings_file)
+
+        if _cached is not None and _cached[0] == _stamps:
+            return _cached
+
+        _models = (
+            _stamps,
+            tasks.get_tasks_json(self.__workspace),
+            tasks.get_settings_json(self.__workspace, settings_file)
+        )
+        self.__models[settings_file] = _models
+
+        return _models
+
+
+    def __reap(self) -> None:
+        for pid in list(self.__children):
+            try:
+                _pid, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                _pid = pid
+
+            if _pid != 0:
+                self.__children.remove(pid)
+
+
+    def serve(self) -> None:
+        # warm the imports, the forked requests will have them loaded
+        from torizon_templates_utils import tasks
+
+        # only one daemon for the workspace
+        _lock = open(f"{self.__path}.lock", "w")
+
+        try:
+            fcntl.flock(_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+
+        if os.path.exists(self.__path):
+            os.unlink(self.__path)
+
+        _server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        _umask = os.umask(0o077)
+        _server.bind(self.__path)
+        os.umask(_umask)
+        _server.listen()
+        _server.settimeout(1.0)
+
+        _last_request = time.monotonic()
+
+        try:
+            while True:
+                self.__reap()
+
+                try:
+                    _conn, _ = _server.accept()
+                except socket.timeout:
+                    if len(self.__children) == 0 and \
+                        time.monotonic() - _last_request > self.__idle_timeout:
+                        break
+                    continue
+
+                _conn.settimeout(None)
+                _last_request = time.monotonic()
+
+                if not self.__handle(_server, _conn):
+                    break
+        finally:
+            os.unlink(self.__path)
+            _server.close()
+            _lock.close()
+
+
+    def __handle(self, server: socket.socket, conn: socket.socket) -> bool:
+        """
+        Serve the request of the connection. Returns False when the daemon
+        should stop.
+        """
+        _fds: List[int] = []
+
+        try:
+            # the daemon run commands, so only the same user can use it
+            _creds = conn.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+            )
+            _, _uid, _ = struct.unpack("3i", _creds)
+
+            if _uid != os.getuid():
+                return True
+
+            _msg, _fds = _MsgReader(conn).read(max_fds=3)
+
+            if _msg is None:
+                return True
+
+            if _msg["cmd"] == "stop":
+                _send_msg(conn, { "code": 0 })
+                return False
+
+            if _msg["cmd"] != "run" or len(_fds) != 3:
+                _send_msg(conn, {
+                    "error": f"Invalid daemon request: {_msg['cmd']}",
+                    "error_type": "ValueError"
+                })
+                return True
+
+            try:
+                _models = self.__load(_msg["settings"])
+            except Exception as ex:
+                _send_msg(conn, {
+                    "error": str(ex),
+                    "error_type": type(ex).__name__
+                })
+                return True
+
+            _pid = os.fork()
+
+            if _pid == 0:
+                server.close()
+                self.__run_child(conn, _msg, _fds, _models)
+
+            self.__children.append(_pid)
+            return True
+        finally:
+            for fd in _fds:
+                os.close(fd)
+
+            conn.close()
+
+
+    def __run_child(
+            self,
+            conn: socket.socket,
+            msg: Dict,
+            fds: List[int],
+            models: Tuple
+        ) -> None:
+        from torizon_templates_utils import tasks
+
+        _code = 0
+
+        try:
+            # own process group, so the client can forward ctrl+c
+            os.setpgid(0, 0)
+
+            for ix, fd in enumerate(fds):
+                os.dup2(fd, ix)
+
+            os.environ.clear()
+            os.environ.update(msg["environ"])
+            os.chdir(msg["cwd"])
+
+            _send_msg(conn, { "pid": os.getpid() })
+
+            _, _tasks, _settings = models
+            _runner = tasks.TaskRunner(
+                _tasks.tasks,
+                _tasks.inputs,
+                _settings,
+                environ=msg["environ"],
+                cwd=self.__workspace
+            )
+            _runner.run_task(
+                msg["label"], force=msg["force"], profile=msg["profile"]
+            )
+
+            sys.stdout.flush()
+            _send_msg(conn, { "code": 0 })
+        except BaseException as ex:
+            _code = 1
+
+            try:
+                sys.stdout.flush()
+                _send_msg(conn, {
+                    "error": str(ex),
+                    "error_type": type(ex).__name__
+                })
+            except OSError:
+                # the client is gone, nobody to report to
+                pass
+        finally:
+            os._exit(_code)
+
+
+if __name__ == "__main__":
+    TaskDaemon(sys.argv[1]).serve()
@@ -1,6 +1,7 @@
 # pylint: disable=missing-function-docstring
 # pylint: disable=missing-module-docstring
-import debugpy # type: ignore[import-untyped]
+
+# debugpy takes a while to import, so it is only imported when used
 
 DEBUG_INITIALIZED = False
 
@@ -10,6 +11,8 @@ def vscode_prepare(port: int = 5679) -> None:
     if DEBUG_INITIALIZED:
         return
 
+    import debugpy # type: ignore[import-untyped]
+
     print("__debugpy__")
     debugpy.listen(("0.0.0.0", port))
     print("__debugpy__ go")
@@ -19,4 +22,6 @@ def vscode_prepare(port: int = 5679) -> None:
     DEBUG_INITIALIZED = True
 
 def breakpoint() -> None:
+    import debugpy # type: ignore[import-untyped]
+
     debugpy.breakpoint()
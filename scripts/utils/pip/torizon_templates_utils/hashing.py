@@ -0,0 +1,95 @@
+
+import os
+import hashlib
+import threading
+from typing import Dict, List, Iterable, Optional
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path: str) -> str:
+    """
+    sha256 of the file content, read in chunks so big files are not loaded
+    to memory at once.
+    """
+    _hash = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(_CHUNK_SIZE), b""):
+            _hash.update(chunk)
+
+    return _hash.hexdigest()
+
+
+class FileHashCache:
+    """
+    FileHashCache keeps the sha256 of files by path together with the
+    mtime and size of the file when it was hashed. While the mtime and size
+    do not change the cached hash is used, so only new or touched files are
+    read. The entries are plain lists, so they can be stored as json.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, List]] = None):
+        # path -> [mtime_ns, size, sha256]
+        self.__entries: Dict[str, List] = entries if entries is not None else {}
+        self.__lock = threading.Lock()
+
+
+    def entries(self) -> Dict[str, List]:
+        return self.__entries
+
+
+    def hash_file(self, path: str) -> str:
+        _stat = os.stat(path)
+
+        with self.__lock:
+            _entry = self.__entries.get(path)
+
+        if _entry is not None and \
+            _entry[0] == _stat.st_mtime_ns and \
+            _entry[1] == _stat.st_size:
+
+            return _entry[2]
+
+        _hash = sha256_file(path)
+
+        with self.__lock:
+            self.__entries[path] = [_stat.st_mtime_ns, _stat.st_size, _hash]
+
+        return _hash
+
+
+    def hash_files(
+            self,
+            paths: Iterable[str],
+            max_workers: Optional[int] = None
+        ) -> Dict[str, str]:
+        """
+        Hash the files in parallel. Returns a dict path -> sha256.
+        """
+        _paths = list(paths)
+
+        if len(_paths) <= 1:
+            return { path: self.hash_file(path) for path in _paths }
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            _hashes = pool.map(self.hash_file, _paths)
+
+            return dict(zip(_paths, _hashes))
+
+
+    def prune(self, keep: Iterable[str]) -> None:
+        """
+        Remove the entries of the paths that are not in keep.
+        """
+        _keep = set(keep)
+
+        with self.__lock:
+            for path in list(self.__entries.keys()):
+                if path not in _keep:
+                    self.__entries.pop(path)
@@ -0,0 +1,155 @@
+
+import os
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Set, Tuple
+from torizon_templates_utils.colors import print, Color
+from torizon_templates_utils.errors import Error, Error_Out
+
+##
+# Import time benchmark of the package.
+# Each module is imported on a fresh interpreter with python -X importtime
+# and the cumulative time is checked against the budget. The modules that
+# are heavy to import must also not be loaded by modules that do not need
+# them on import. Run it with:
+#
+#   python3 -m torizon_templates_utils.importtime [--runs N] [--scale F]
+##
+
+# module -> budget in milliseconds, on top of the interpreter start
+_BUDGETS: Dict[str, float] = {
+    "torizon_templates_utils.colors": 5,
+    "torizon_templates_utils.errors": 5,
+    "torizon_templates_utils.args": 5,
+    "torizon_templates_utils.debug": 5,
+    "torizon_templates_utils.animations": 5,
+    "torizon_templates_utils.profiling": 10,
+    "torizon_templates_utils.placeholders": 10,
+    "torizon_templates_utils.scaffold": 15,
+    "torizon_templates_utils.template_cache": 10,
+    "torizon_templates_utils.hashing": 15,
+    "torizon_templates_utils.network": 15,
+    "torizon_templates_utils.daemon": 25,
+    "torizon_templates_utils.tasks": 40,
+}
+
+# modules that none of the package modules should load on import
+_LAZY_MODULES = [
+    "yaml",
+    "debugpy",
+    "inspect",
+    "mimetypes",
+    "concurrent.futures",
+    "torizon_io_api",
+    "requests",
+]
+
+
+def _import_time(module: str, env: Dict[str, str]) -> Tuple[float, Set[str]]:
+    """
+    Import [module] on a new interpreter. Returns the cumulative import time
+    of the module in milliseconds and the modules loaded by it.
+    """
+    _ret = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env
+    )
+
+    if _ret.returncode != 0:
+        raise RuntimeError(f"Error importing {module}: {_ret.stderr}")
+
+    _time = 0.0
+    _loaded: Set[str] = set()
+    _inside = False
+
+    # the imports of the module are listed before it, indented
+    for line in reversed(_ret.stderr.splitlines()):
+        if not line.startswith("import time:"):
+            continue
+
+        _, _cumulative, _name = line.split("|")
+
+        if _name.strip() == module and not _name.startswith("  "):
+            _time = int(_cumulative) / 1000
+            _inside = True
+        elif _inside and _name.startswith("  "):
+            _loaded.add(_name.strip())
+        elif _inside:
+            break
+
+    return _time, _loaded
+
+
+def main(argv: List[str]) -> None:
+    _parser = argparse.ArgumentParser(
+        prog="python3 -m torizon_templates_utils.importtime",
+        description="Import time benchmark of torizon_templates_utils"
+    )
+    _parser.add_argument(
+        "--runs", type=int, default=5,
+        help="imports of each module, the fastest one is used (default: 5)"
+    )
+    _parser.add_argument(
+        "--scale", type=float, default=1.0,
+        help="multiply the budgets, for slow machines (default: 1.0)"
+    )
+    _args = _parser.parse_args(argv)
+
+    # the bytecode need to be cached, otherwise we are measuring the compile
+    _env = dict(os.environ)
+    _env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    _failed: List[str] = []
+
+    print(f"{'module':<40} {'time':>9} {'budget':>9}", color=Color.BLUE)
+
+    for module, budget in _BUDGETS.items():
+        _budget = budget * _args.scale
+
+        # warm up, writes the bytecode cache
+        _import_time(module, _env)
+
+        _time = float("inf")
+        _loaded: Set[str] = set()
+
+        for _ in range(max(1, _args.runs)):
+            _run_time, _loaded = _import_time(module, _env)
+            _time = min(_time, _run_time)
+
+        _lazy = [
+            lazy for lazy in _LAZY_MODULES
+            if lazy in _loaded and lazy != module
+        ]
+
+        _color = Color.GREEN
+
+        if _time > _budget:
+            _failed.append(f"{module} took {_time:.1f}ms, budget {_budget:.1f}ms")
+            _color = Color.RED
+
+        for lazy in _lazy:
+            _failed.append(f"{module} imports {lazy}, it should be imported when used")
+            _color = Color.RED
+
+        print(
+            f"{module:<40} {_time:>7.1f}ms {_budget:>7.1f}ms",
+            color=_color
+        )
+
+    if len(_failed) > 0:
+        print("")
+
+        for fail in _failed:
+            print(f"❌ {fail}", color=Color.RED)
+
+        Error_Out("Import time budget exceeded", Error.EFAIL)
+
+    print("")
+    print("✅ Import time budget ok", color=Color.GREEN)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
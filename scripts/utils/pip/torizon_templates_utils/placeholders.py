@@ -0,0 +1,184 @@
+
+import os
+import re
+from typing import Dict, List, Optional
+
+# files bigger than this are processed in chunks instead of in memory
+_STREAM_SIZE = 4 * 1024 * 1024
+_CHUNK_SIZE = 1024 * 1024
+
+
+class PlaceholderReplacer:
+    """
+    PlaceholderReplacer replaces all the placeholders of [replacements] on a
+    single scan of the content, instead of one str.replace per placeholder.
+    The files are only written when something changed, atomically, so the
+    files without placeholders keep their mtime.
+    """
+
+    def __init__(self, replacements: Dict[str, str]):
+        self.__replacements = {
+            placeholder: value
+            for placeholder, value in replacements.items()
+            if placeholder != ""
+        }
+        self.__max_len = max(
+            (len(placeholder) for placeholder in self.__replacements),
+            default=0
+        )
+
+        # the longest first, so a placeholder that starts with another one
+        # still wins
+        self.__pattern: Optional[re.Pattern] = None
+
+        if len(self.__replacements) > 0:
+            self.__pattern = re.compile("|".join(
+                re.escape(placeholder) for placeholder in sorted(
+                    self.__replacements, key=len, reverse=True
+                )
+            ))
+
+
+    def __sub(self, match: "re.Match") -> str:
+        return self.__replacements[match.group(0)]
+
+
+    def replace(self, content: str) -> str:
+        if self.__pattern is None:
+            return content
+
+        return self.__pattern.sub(self.__sub, content)
+
+
+    def placeholders(self) -> List[str]:
+        return sorted(self.__replacements)
+
+
+    def contains(self, content: str) -> bool:
+        """
+        If there is any of the placeholders on [content], even if replacing
+        it would not change the content.
+        """
+        if self.__pattern is None:
+            return False
+
+        return self.__pattern.search(content) is not None
+
+
+    def __changes(self, content: str) -> bool:
+        if self.__pattern is None:
+            return False
+
+        for match in self.__pattern.finditer(content):
+            if self.__replacements[match.group(0)] != match.group(0):
+                return True
+
+        return False
+
+
+    def __stream_changes(self, path: str) -> bool:
+        # the placeholders can be split between two chunks, so the end of
+        # the previous chunk is scanned again with the next one
+        _tail = ""
+
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            while True:
+                _chunk = file.read(_CHUNK_SIZE)
+
+                if not _chunk:
+                    return False
+
+                _buffer = _tail + _chunk
+
+                if self.__changes(_buffer):
+                    return True
+
+                _tail = _buffer[-(self.__max_len - 1):] \
+                    if self.__max_len > 1 else ""
+
+
+    def __stream_replace(self, src: str, dst) -> None:
+        _buffer = ""
+
+        with open(src, "r", encoding="utf-8", newline="") as file:
+            while True:
+                _chunk = file.read(_CHUNK_SIZE)
+                _eof = not _chunk
+                _buffer += _chunk
+
+                # a placeholder that starts before [_safe] is complete on
+                # the buffer, the ones after can continue on the next chunk
+                _safe = len(_buffer) if _eof \
+                    else len(_buffer) - (self.__max_len - 1)
+                _pos = 0
+
+                for match in self.__pattern.finditer(_buffer):
+                    if match.start() >= _safe:
+                        break
+
+                    dst.write(_buffer[_pos:match.start()])
+                    dst.write(self.__sub(match))
+                    _pos = match.end()
+
+                _keep = max(_pos, _safe)
+                dst.write(_buffer[_pos:_keep])
+                _buffer = _buffer[_keep:]
+
+                if _eof:
+                    return
+
+
+    def replace_file(self, src: str, dst: Optional[str] = None) -> bool:
+        """
+        Replace the placeholders of the [src] file and write the result to
+        [dst], or back to [src] if [dst] is not set. Nothing is written if
+        the file has no placeholders, or if it is not utf-8 text. Returns
+        True if the file was written.
+        """
+        if self.__pattern is None:
+            return False
+
+        if dst is None:
+            dst = src
+
+        try:
+            if os.path.getsize(src) <= _STREAM_SIZE:
+                with open(src, "r", encoding="utf-8", newline="") as file:
+                    _content = file.read()
+
+                if not self.__changes(_content):
+                    return False
+
+                _write_atomic(src, dst, lambda file: file.write(
+                    self.replace(_content)
+                ))
+            else:
+                if not self.__stream_changes(src):
+                    return False
+
+                _write_atomic(src, dst, lambda file: self.__stream_replace(
+                    src, file
+                ))
+        except UnicodeDecodeError:
+            return False
+
+        return True
+
+
+def _write_atomic(src: str, dst: str, write) -> None:
+    import tempfile
+
+    _fd, _tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(dst)),
+        prefix=f".{os.path.basename(dst)}."
+    )
+
+    try:
+        with os.fdopen(_fd, "w", encoding="utf-8", newline="") as file:
+            write(file)
+
+        os.chmod(_tmp, os.stat(src).st_mode & 0o7777)
+        os.replace(_tmp, dst)
+    except BaseException:
+        os.unlink(_tmp)
+        raise
@@ -0,0 +1,206 @@
+
+import os
+import json
+import time
+import threading
+from typing import IO, Dict, List, Optional
+from torizon_templates_utils.colors import print, Color
+
+
+class TaskTiming:
+    __slots__ = (
+        'label',
+        'start',
+        'end',
+        'cpu',
+        'exit_code',
+        'skipped',
+        'lane',
+    )
+
+    def __init__(
+            self,
+            label: str,
+            start: float,
+            end: float,
+            cpu: Optional[float],
+            exit_code: Optional[int],
+            skipped: bool,
+            lane: int
+        ):
+
+        self.label = label
+        self.start = start
+        self.end = end
+        self.cpu = cpu
+        self.exit_code = exit_code
+        self.skipped = skipped
+        self.lane = lane
+
+    @property
+    def wall(self) -> float:
+        return self.end - self.start
+
+
+class TaskProfiler:
+    """
+    TaskProfiler collects the timing of each task executed by the
+    TaskRunner, streams the tasks output tagged with the task label and
+    generates the timing report and the trace file.
+    Times are in seconds relative to the creation of the profiler.
+    """
+
+    def __init__(self):
+        self.__origin = time.perf_counter()
+        self.__epoch = time.time()
+        self.__timings: Dict[str, TaskTiming] = {}
+        self.__lanes: Dict[int, int] = {}
+        self.__lock = threading.Lock()
+        self.__print_lock = threading.Lock()
+
+
+    def now(self) -> float:
+        return time.perf_counter() - self.__origin
+
+
+    def __lane(self) -> int:
+        # each worker thread is a lane on the trace
+        _ident = threading.get_ident()
+
+        if _ident not in self.__lanes:
+            self.__lanes[_ident] = len(self.__lanes)
+
+        return self.__lanes[_ident]
+
+
+    def record(
+            self,
+            label: str,
+            start: float,
+            cpu: Optional[float] = None,
+            exit_code: Optional[int] = None,
+            skipped: bool = False
+        ) -> None:
+        _end = self.now()
+
+        with self.__lock:
+            self.__timings[label] = TaskTiming(
+                label, start, _end, cpu, exit_code, skipped, self.__lane()
+            )
+
+
+    def stream(self, label: str, pipe: IO[bytes]) -> None:
+        """
+        Print the output of the task line by line, tagged with the time and
+        the task label, until the task closes it.
+        """
+        for line in iter(pipe.readline, b""):
+            _line = line.decode(errors="replace").rstrip("\r\n")
+
+            with self.__print_lock:
+                print(f"[{self.now():8.3f}s] [{label}] {_line}", flush=True)
+
+        pipe.close()
+
+
+    def critical_path(
+            self, label: str, predecessors: Dict[str, List[str]]
+        ) -> List[str]:
+        """
+        Walk back from the task [label] always following the predecessor
+        that finished last, the chain of tasks that defined the total time.
+        """
+        _path: List[str] = []
+        _label: Optional[str] = label
+
+        while _label is not None and _label in self.__timings:
+            _path.insert(0, _label)
+            _start = self.__timings[_label].start
+            _next = None
+
+            for pred in predecessors.get(_label, []):
+                _timing = self.__timings.get(pred)
+
+                # only the ones that were done when this one started
+                if _timing is None or _timing.end > _start or pred in _path:
+                    continue
+
+                if _next is None or _timing.end > self.__timings[_next].end:
+                    _next = pred
+
+            _label = _next
+
+        return _path
+
+
+    def print_report(
+            self, label: str, predecessors: Dict[str, List[str]]
+        ) -> None:
+        _critical = self.critical_path(label, predecessors)
+        _timings = sorted(self.__timings.values(), key=lambda t: t.start)
+        _width = max([len(t.label) for t in _timings] + [4])
+
+        print("")
+        print(
+            f"  {'task'.ljust(_width)}  {'start':>9}  {'wall':>9}  {'cpu':>9}  exit",
+            color=Color.BLUE
+        )
+
+        for timing in _timings:
+            _cpu = f"{timing.cpu:8.3f}s" if timing.cpu is not None else f"{'-':>9}"
+
+            if timing.skipped:
+                _exit = "skip"
+            elif timing.exit_code is None:
+                _exit = "-"
+            else:
+                _exit = str(timing.exit_code)
+
+            print(
+                f"{'*' if timing.label in _critical else ' '} "
+                f"{timing.label.ljust(_width)}  "
+                f"{timing.start:8.3f}s  {timing.wall:8.3f}s  {_cpu}  {_exit}"
+            )
+
+        # the task [label] did not run, an error stopped the tree before it
+        if len(_critical) == 0:
+            return
+
+        _total = sum(self.__timings[_label].wall for _label in _critical)
+
+        print("")
+        print(
+            f"Critical path (*): {' -> '.join(_critical)} [{_total:.3f}s]",
+            color=Color.BLUE
+        )
+
+
+    def write_trace(self, path: str) -> None:
+        """
+        Write the timings on the Chrome trace event format, that can be
+        opened on chrome://tracing or https://ui.perfetto.dev
+        """
+        _events = []
+
+        for timing in self.__timings.values():
+            _events.append({
+                "name": timing.label,
+                "cat": "skipped" if timing.skipped else "task",
+                "ph": "X",
+                "ts": int((self.__epoch + timing.start) * 1e6),
+                "dur": int(timing.wall * 1e6),
+                "pid": os.getpid(),
+                "tid": timing.lane,
+                "args": {
+                    "cpu_s": timing.cpu,
+                    "exit_code": timing.exit_code
+                }
+            })
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'w') as file:
+            json.dump({
+                "traceEvents": _events,
+                "displayTimeUnit": "ms"
+            }, file, indent=4)
@@ -0,0 +1,121 @@
+
+import os
+import shutil
+from typing import Dict, List, Optional, Set, Tuple
+from torizon_templates_utils.placeholders import PlaceholderReplacer
+
+# the file is considered binary if there is a NUL byte on its beginning
+_BINARY_SNIFF_SIZE = 8192
+
+
+def is_binary(path: str) -> bool:
+    with open(path, 'rb') as file:
+        return b"\0" in file.read(_BINARY_SNIFF_SIZE)
+
+
+def _copy_mode(src: str, dst: str, umask: int) -> None:
+    # same as cp, the mode of the source without the umask bits
+    os.chmod(dst, os.stat(src).st_mode & 0o7777 & ~umask)
+
+
+def _materialize_file(
+        src: str, dst: str, replacer: PlaceholderReplacer, umask: int
+    ) -> None:
+    # ssh keys are copied as they are, and the private one is read only
+    if "id_rsa" in dst:
+        shutil.copyfile(src, dst)
+        _copy_mode(src, dst, umask)
+
+        if "id_rsa.pub" not in dst:
+            os.chmod(dst, 0o400)
+
+        return
+
+    if is_binary(src):
+        shutil.copyfile(src, dst)
+        _copy_mode(src, dst, umask)
+        return
+
+    # the text files with placeholders are written already replaced, the
+    # others are copied as they are
+    if not replacer.replace_file(src, dst):
+        shutil.copyfile(src, dst)
+
+    _copy_mode(src, dst, umask)
+
+
+def materialize(
+        sources: List[Tuple[str, str]],
+        dst_root: str,
+        replacements: Dict[str, str],
+        path_replacements: Optional[Dict[str, str]] = None,
+        skip: Optional[Set[str]] = None,
+        max_workers: Optional[int] = None
+    ) -> int:
+    """
+    Copy each (source, destination) of [sources] to [dst_root], where the
+    source is a file or folder and the destination is relative to
+    [dst_root]. In the same pass the [path_replacements] are applied to the
+    destination paths and the [replacements] to the content of the text
+    files, so each file is read and written only once. The files are
+    processed in parallel. The relative destinations in [skip] are not
+    copied. Returns the number of files copied.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    _replacer = PlaceholderReplacer(replacements)
+    _path_replacer = PlaceholderReplacer(
+        path_replacements if path_replacements is not None else {}
+    )
+    _skip = skip if skip is not None else set()
+    _files: List[Tuple[str, str]] = []
+
+    def _dst_path(rel: str) -> str:
+        return os.path.join(
+            dst_root,
+            _path_replacer.replace(os.path.normpath(rel))
+        )
+
+    def _add(src: str, rel: str) -> None:
+        if os.path.normpath(rel) in _skip:
+            return
+
+        if os.path.islink(src):
+            _dst = _dst_path(rel)
+            os.makedirs(os.path.dirname(_dst), exist_ok=True)
+            os.symlink(os.readlink(src), _dst)
+        else:
+            _files.append((src, _dst_path(rel)))
+
+    # create the folders first, the file copies only need them to exist
+    for src, dst in sources:
+        if os.path.isdir(src) and not os.path.islink(src):
+            for root, dirs, files in os.walk(src):
+                _rel_root = os.path.join(dst, os.path.relpath(root, src))
+                os.makedirs(_dst_path(_rel_root), exist_ok=True)
+
+                # symlinks to folders are copied as links
+                for name in dirs + files:
+                    _src = os.path.join(root, name)
+
+                    if name in files or os.path.islink(_src):
+                        _add(_src, os.path.join(_rel_root, name))
+        else:
+            os.makedirs(os.path.dirname(_dst_path(dst)), exist_ok=True)
+            _add(src, dst)
+
+    # the umask is process wide, read it before starting the threads
+    _umask = os.umask(0)
+    os.umask(_umask)
+
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) + 4)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # list to raise the first error
+        list(pool.map(
+            lambda job: _materialize_file(job[0], job[1], _replacer, _umask),
+            _files
+        ))
+
+    return len(_files)
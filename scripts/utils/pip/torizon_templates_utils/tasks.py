@@ -1,18 +1,33 @@
 
+from __future__ import annotations
+
 import os
 import re
-import yaml # type: ignore[import-untyped]
 import json
-import inspect
-import mimetypes
+import pickle
+import hashlib
+import functools
+import threading
 import subprocess
-from pathlib import Path
 from typing import List, Dict, Type, TypeVar, Union, Tuple, Optional, Literal
+from typing import TYPE_CHECKING
 from torizon_templates_utils.colors import print, Color
+from torizon_templates_utils.hashing import FileHashCache
+
+# these are heavy to import and only used on some code paths, so they are
+# imported where they are used, keeping list, desc and the scripts that
+# only need the models fast to start
+if TYPE_CHECKING:
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from torizon_templates_utils.profiling import TaskProfiler
+    from torizon_templates_utils.torizon_io import TorizonPlatform
 
 T = TypeVar('T')
 
 def replace_tasks_input():
+    import mimetypes
+    from pathlib import Path
+
     for file in Path('.').rglob('*.json'):
         print(file)
         mime_type, _ = mimetypes.guess_type(file)
@@ -30,34 +45,160 @@ def replace_tasks_input():
                     f.write(content)
 
 
+# cls -> (constructor argument names, if the cls accepts the any argument)
+# inspect.signature is expensive, so it is computed only once per class
+_SCHEMAS: Dict[type, Tuple[frozenset, bool]] = {}
+
+
+def _get_schema(cls: type) -> Tuple[frozenset, bool]:
+    _schema = _SCHEMAS.get(cls)
+
+    if _schema is None:
+        import inspect
+
+        _params = inspect.signature(cls.__init__).parameters
+        _schema = (frozenset(_params.keys()), 'any' in _params)
+        _SCHEMAS[cls] = _schema
+
+    return _schema
+
+
 def _cast_from_json(json_data, cls: Type[T]) -> T:
-    # check on json_data if there is some key with . like "name.prop"
-    # if so, we need change the key to something like "name_prop"
-    keys = list(json_data.keys())
-    for key in keys:
+    expected_args, has_any = _get_schema(cls)
+    filtered_data = {}
+    non_expected_args = {}
+
+    for key, value in json_data.items():
+        # keys with . like "name.prop" are mapped to "name_prop"
         if '.' in key:
-            new_key = key.replace('.', '_')
-            json_data[new_key] = json_data.pop(key)
+            key = key.replace('.', '_')
 
-    expected_args = inspect.signature(cls.__init__).parameters
-    filtered_data = {k: v for k, v in json_data.items() if k in expected_args}
+        if key in expected_args:
+            filtered_data[key] = value
+        else:
+            non_expected_args[key] = value
 
     # check if the cls type has the any attribute
     # the any attribute is a Dict[str, str]
     # and it store the non expected args
-    if 'any' in expected_args:
-        non_expected_args = {k: v for k, v in json_data.items() if k not in expected_args}
+    if has_any:
         filtered_data['any'] = non_expected_args
 
     return cls(**filtered_data)
 
 
+def _to_dict(obj) -> Dict:
+    """
+    The model classes use __slots__, so there is no __dict__ to dump.
+    """
+    _ret = {}
+
+    for key in obj.__slots__:
+        value = getattr(obj, key)
+
+        if hasattr(value, "__slots__"):
+            value = _to_dict(value)
+        elif isinstance(value, list):
+            value = [_to_dict(v) if hasattr(v, "__slots__") else v for v in value]
+
+        _ret[key] = value
+
+    return _ret
+
+
+# ${workspaceFolder}, ${workspaceFolderBasename}, ${config:id}, ${env:id},
+# ${input:id} and ${command:id} references used on tasks.json
+_VARIABLE_PATTERN = re.compile(
+    r"\$\{(workspaceFolderBasename|workspaceFolder|(?:config|env|input|command):[^}]*?)\s*\}"
+)
+
+_SPECIAL_CHARS_PATTERN = re.compile(r"[^a-zA-Z0-9\.\-_|>\/=+&_]")
+
+# a segment is a literal string or a (kind, name, raw) variable reference
+_Segment = Union[str, Tuple[str, str, str]]
+
+
+def _compile_variable(ref: str) -> Optional[Tuple[str, str, str]]:
+    if ref == "workspaceFolder" or ref == "workspaceFolderBasename":
+        return ("env", ref, ref)
+
+    kind, _, name = ref.partition(":")
+
+    if kind == "command":
+        # the torizon and docker commands are read from the settings
+        if name.startswith("torizon_") or name.startswith("docker_"):
+            kind = "config"
+        elif name == "tcb.getNextPackageVersion" or name == "tcb.outputTEZIFolder":
+            return ("tcb", name[len("tcb."):], name)
+        elif name.startswith("tcb."):
+            kind = "config"
+        else:
+            # not something that we know how to resolve
+            return None
+
+    if kind == "config":
+        # the settings keys with . are mapped with _
+        return ("config", name.replace(".", "_"), name)
+
+    return (kind, name, name)
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_variables(value: str) -> Tuple[_Segment, ...]:
+    """
+    Tokenize the ${...} references of a tasks.json string. The result is
+    cached, so each string is parsed only once.
+    """
+    _segments: List[_Segment] = []
+    _last = 0
+
+    for match in _VARIABLE_PATTERN.finditer(value):
+        _var = _compile_variable(match.group(1))
+
+        if _var is None:
+            continue
+
+        if match.start() > _last:
+            _segments.append(value[_last:match.start()])
+
+        _segments.append(_var)
+        _last = match.end()
+
+    if _last < len(value) or len(_segments) == 0:
+        _segments.append(value[_last:])
+
+    return tuple(_segments)
+
+
 # For Settings interface we are mapping only the Torizon specific settings
 class TorizonSettings:
     """
     TorizonSettings is a interface to map specific VS Code settings defined
     by the Torizon extension.
     """
+    __slots__ = (
+        'torizon_psswd',
+        'torizon_login',
+        'torizon_ip',
+        'torizon_ssh_port',
+        'host_ip',
+        'torizon_workspace',
+        'torizon_debug_ssh_port',
+        'torizon_debug_port1',
+        'torizon_debug_port2',
+        'torizon_debug_port3',
+        'torizon_gpu',
+        'torizon_arch',
+        'wait_sync',
+        'torizon_run_as',
+        'torizon_app_root',
+        'docker_tag',
+        'tcb_packageName',
+        'tcb_version',
+        'torizon_gpuPrefixRC',
+        'any',
+    )
+
     def __init__(
             self,
             torizon_psswd: Optional[str] = None,
@@ -108,11 +249,22 @@ class TorizonSettings:
 # https://code.visualstudio.com/docs/editor/tasks-appendix
 
 class ShellConfiguration:
+    __slots__ = (
+        'executable',
+        'args',
+    )
+
     def __init__(self, executable: str, args: Optional[List[str]]):
         self.executable = executable
         self.args = args
 
 class CommandOptions:
+    __slots__ = (
+        'cwd',
+        'env',
+        'shell',
+    )
+
     def __init__(
             self,
             cwd: Optional[str] = None,
@@ -131,6 +283,16 @@ class CommandOptions:
 
 
 class PresentationOptions:
+    __slots__ = (
+        'reveal',
+        'echo',
+        'focus',
+        'panel',
+        'showReuseMessage',
+        'clear',
+        'group',
+    )
+
     def __init__(
             self,
             reveal: Optional[Literal['never', 'silent', 'always']] = None,
@@ -152,6 +314,21 @@ class PresentationOptions:
 
 
 class ProblemPattern:
+    __slots__ = (
+        'regexp',
+        'kind',
+        'file',
+        'location',
+        'line',
+        'column',
+        'endLine',
+        'endColumn',
+        'severity',
+        'code',
+        'message',
+        'loop',
+    )
+
     def __init__(
             self,
             regexp: str,
@@ -183,6 +360,12 @@ class ProblemPattern:
 
 
 class BackgroundMatcher:
+    __slots__ = (
+        'activeOnStart',
+        'beginsPattern',
+        'endsPattern',
+    )
+
     def __init__(
             self,
             activeOnStart: Optional[bool] = False,
@@ -196,6 +379,16 @@ class BackgroundMatcher:
 
 
 class ProblemMatcher:
+    __slots__ = (
+        'base',
+        'owner',
+        'source',
+        'severity',
+        'fileLocation',
+        'pattern',
+        'background',
+    )
+
     def __init__(
             self,
             base: Optional[str] = None,
@@ -230,6 +423,11 @@ class ProblemMatcher:
 
 
 class RunOptions:
+    __slots__ = (
+        'reevaluateOnRerun',
+        'runOn',
+    )
+
     def __init__(
             self,
             reevaluateOnRerun: Optional[bool] = True,
@@ -241,6 +439,11 @@ class RunOptions:
 
 
 class IconOptions:
+    __slots__ = (
+        'id',
+        'color',
+    )
+
     def __init__(
             self,
             id: str,
@@ -252,6 +455,14 @@ class IconOptions:
 
 
 class InputOptions:
+    __slots__ = (
+        'id',
+        'description',
+        'default',
+        'type',
+        'options',
+    )
+
     def __init__(
             self,
             id: str,
@@ -269,6 +480,25 @@ class InputOptions:
 
 
 class TaskDescription:
+    __slots__ = (
+        'label',
+        'type',
+        'command',
+        'hide',
+        'isBackground',
+        'args',
+        'options',
+        'group',
+        'presentation',
+        'problemMatcher',
+        'runOptions',
+        'dependsOrder',
+        'dependsOn',
+        'icon',
+        'inputs',
+        'outputs',
+    )
+
     def __init__(
             self,
             label: str,
@@ -284,7 +514,9 @@ class TaskDescription:
             runOptions: Optional[RunOptions] = None,
             dependsOrder: Optional[Literal['sequence', 'parallel']] = None,
             dependsOn: Optional[List[str]] = None,
-            icon: Optional[IconOptions] = None
+            icon: Optional[IconOptions] = None,
+            inputs: Optional[List[str]] = None,
+            outputs: Optional[List[str]] = None
         ):
 
         self.label = label
@@ -301,6 +533,10 @@ class TaskDescription:
         self.dependsOrder = dependsOrder
         self.dependsOn = dependsOn
         self.icon = icon
+        # Torizon extension: files or globs that the task reads and writes
+        # when set the task is skipped if nothing changed since the last run
+        self.inputs = inputs
+        self.outputs = outputs
 
         # we are getting this data from json
         # so we need to cast the classes dependencies
@@ -323,18 +559,31 @@ class TaskDescription:
             'command': self.command,
             'isBackground': self.isBackground,
             'args': self.args,
-            'options': self.options.__dict__ if self.options else None,
+            'options': _to_dict(self.options) if self.options else None,
             'group': self.group,
-            'presentation': self.presentation.__dict__ if self.presentation else None,
+            'presentation': _to_dict(self.presentation) if self.presentation else None,
             'problemMatcher': self.problemMatcher,
-            'runOptions': self.runOptions.__dict__ if self.runOptions else None,
+            'runOptions': _to_dict(self.runOptions) if self.runOptions else None,
             'dependsOrder': self.dependsOrder,
             'dependsOn': self.dependsOn,
-            'icon': self.icon.__dict__ if self.icon else None
+            'icon': _to_dict(self.icon) if self.icon else None,
+            'inputs': self.inputs,
+            'outputs': self.outputs
         }
 
 
 class BaseTaskConfiguration:
+    __slots__ = (
+        'type',
+        'command',
+        'isBackground',
+        'options',
+        'args',
+        'presentation',
+        'problemMatcher',
+        'tasks',
+    )
+
     def __init__(
             self,
             type: str,
@@ -362,6 +611,15 @@ class TaskConfiguration:
     TorizonConfiguration is a interface to map tasks.json file
     """
 
+    __slots__ = (
+        'version',
+        'tasks',
+        'inputs',
+        'windows',
+        'osx',
+        'linux',
+    )
+
     def __init__(
             self,
             version: Literal['2.0.0'] = '2.0.0',
@@ -391,9 +649,93 @@ class TaskConfiguration:
         # as them are not used in the templates
 
 
+# bump this when the model classes change, so old caches are discarded
+_CACHE_VERSION = 3
+_CACHE_FOLDER = ".conf/.cache"
+
+
+def _write_cache(cache_path: str, cache: Dict) -> None:
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+        # write to a temporary file and then replace, so concurrent
+        # calls never read a partial cache
+        _tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(_tmp_path, 'wb') as file:
+            pickle.dump(cache, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(_tmp_path, cache_path)
+    except OSError:
+        # the cache is only an optimization, read only workspaces are fine
+        pass
+
+
+def _read_cache(cache_path: str) -> Optional[Dict]:
+    try:
+        # only trust caches created by the current user
+        if os.stat(cache_path).st_uid != os.getuid():
+            return None
+
+        with open(cache_path, 'rb') as file:
+            _cache = pickle.load(file)
+
+        if _cache.get("version") != _CACHE_VERSION:
+            return None
+
+        return _cache
+    except Exception:
+        # missing, corrupted or from an incompatible version
+        return None
+
+
+def _load_json_cached(file_path: str, json_file: str, cls: Type[T]) -> T:
+    """
+    Load the .vscode/[json_file] of the workspace [file_path] casted to cls.
+    The casted object is stored on .conf/.cache and reused while the json
+    file is not changed, checking first the mtime and size and then the
+    content hash.
+    """
+    _json_path = f"{file_path}/.vscode/{json_file}"
+
+    if "TASKS_DISABLE_CACHE" in os.environ:
+        with open(_json_path, 'r') as file:
+            return _cast_from_json(json.load(file), cls)
+
+    _cache_name = json_file.replace(os.sep, "_")
+    _cache_path = f"{file_path}/{_CACHE_FOLDER}/{_cache_name}.pickle"
+    _stat = os.stat(_json_path)
+    _cache = _read_cache(_cache_path)
+
+    if _cache is not None and \
+        _cache["mtime"] == _stat.st_mtime_ns and \
+        _cache["size"] == _stat.st_size:
+
+        return _cache["data"]
+
+    with open(_json_path, 'rb') as file:
+        _content = file.read()
+
+    _hash = hashlib.sha256(_content).hexdigest()
+
+    if _cache is not None and _cache["hash"] == _hash:
+        # touched but not changed, only refresh the stamps
+        _data = _cache["data"]
+    else:
+        _data = _cast_from_json(json.loads(_content), cls)
+
+    _write_cache(_cache_path, {
+        "version": _CACHE_VERSION,
+        "mtime": _stat.st_mtime_ns,
+        "size": _stat.st_size,
+        "hash": _hash,
+        "data": _data
+    })
+
+    return _data
+
+
 def get_tasks_json(file_path: str) -> TaskConfiguration:
-    with open(f"{file_path}/.vscode/tasks.json", 'r') as file:
-        return _cast_from_json(json.load(file), TaskConfiguration)
+    return _load_json_cached(file_path, "tasks.json", TaskConfiguration)
 
 
 def get_settings_json(
@@ -402,12 +744,34 @@ def get_settings_json(
 ) -> TorizonSettings:
     _file = custom_file if custom_file else "settings.json"
 
-    with open(f"{file_path}/.vscode/{_file}", 'r') as file:
-        _tor_settings = _cast_from_json(json.load(file), TorizonSettings)
+    return _load_json_cached(file_path, _file, TorizonSettings)
 
 
+class TaskContext:
+    """
+    TaskContext carries everything needed to resolve and run a single task:
+    the settings, the inputs, the environment with the task env overlay and
+    the cwd. Tasks do not share state through os.environ or os.chdir.
+    """
+    __slots__ = (
+        'config',
+        'inputs',
+        'env',
+        'cwd',
+    )
 
-        return _tor_settings
+    def __init__(
+            self,
+            config: Dict[str, str],
+            inputs: Dict[str, str],
+            env: Dict[str, str],
+            cwd: str
+        ):
+
+        self.config = config
+        self.inputs = inputs
+        self.env = env
+        self.cwd = cwd
 
 
 class TaskRunner:
@@ -420,7 +784,9 @@ class TaskRunner:
             tasks: List[TaskDescription],
             inputs: List[InputOptions],
             settings: TorizonSettings,
-            debug: bool = False
+            debug: bool = False,
+            environ: Optional[Dict[str, str]] = None,
+            cwd: Optional[str] = None
         ):
 
         self.__tasks = tasks
@@ -430,41 +796,105 @@ class TaskRunner:
         self.__gitlab_ci = False
         self.__override_env = True
         self.__cli_inputs: Dict[str, str] = {}
+        self.__config: Dict[str, str] = {}
         self.__can_receive_interactive_input = False
+        self.__max_parallel = os.cpu_count() or 1
+        self.__schedule_lock = threading.Lock()
+        self.__input_lock = threading.Lock()
+        self.__failed = False
+        self.__force = False
+        self.__state: Optional[Dict] = None
+        self.__state_lock = threading.Lock()
+        self.__file_hashes: Optional[FileHashCache] = None
+        self.__profiler: Optional[TaskProfiler] = None
+        # package name -> next version, resolved once per run_task
+        self.__next_versions: Dict[str, str] = {}
+        self.__platform: Optional[TorizonPlatform] = None
+        self.__platform_lock = threading.Lock()
+
+        # the base environment and cwd of the tasks, these are copied
+        # here so the runner never reads or changes the process ones
+        self.__environ: Dict[str, str] = dict(
+            environ if environ is not None else os.environ
+        )
+        self.__cwd = cwd if cwd is not None else os.getcwd()
 
         # check if we have stdin
-        if os.isatty(0) and ("TASKS_DISABLE_INTERACTIVE_INPUT" not in os.environ):
+        if os.isatty(0) and ("TASKS_DISABLE_INTERACTIVE_INPUT" not in self.__environ):
             self.__can_receive_interactive_input = True
 
-        # environment configs
-        if "DOCKER_PSSWD" in os.environ:
-            os.environ["config:docker_password"] = os.environ["DOCKER_PSSWD"]
-
-        if "GITLAB_CI" in os.environ:
+        if "GITLAB_CI" in self.__environ:
             self.__gitlab_ci = True
 
-        if "TASKS_OVERRIDE_ENV" in os.environ:
+        if "TASKS_OVERRIDE_ENV" in self.__environ:
             self.__override_env = False
 
-        if "TASKS_DEBUG" in os.environ:
+        if "TASKS_DEBUG" in self.__environ:
             self.__debug = True
 
-        self.__settings_to_env()
+        if "TASKS_MAX_PARALLEL" in self.__environ:
+            self.__max_parallel = max(1, int(self.__environ["TASKS_MAX_PARALLEL"]))
+
+        self.__settings_to_config()
+        self.__build_indexes()
+
+
+    def __build_indexes(self):
+        """
+        Index the tasks by label and the inputs by id. In case of duplicates
+        the first definition is used, as VS Code does, but we warn about it.
+        """
+        self.__tasks_index: Dict[str, TaskDescription] = {}
+        self.__inputs_index: Dict[str, InputOptions] = {}
+        _dup_labels: List[str] = []
+        _dup_ids: List[str] = []
+
+        for task in self.__tasks:
+            if task.label in self.__tasks_index:
+                _dup_labels.append(task.label)
+            else:
+                self.__tasks_index[task.label] = task
+
+        for _input in (self.__inputs or []):
+            if _input.id in self.__inputs_index:
+                _dup_ids.append(_input.id)
+            else:
+                self.__inputs_index[_input.id] = _input
+
+        if len(_dup_labels) > 0:
+            print(
+                f"⚠️ Duplicated task labels, using the first definition of: {', '.join(_dup_labels)}",
+                color=Color.YELLOW
+            )
+
+        if len(_dup_ids) > 0:
+            print(
+                f"⚠️ Duplicated input ids, using the first definition of: {', '.join(_dup_ids)}",
+                color=Color.YELLOW
+            )
 
 
-    def __settings_to_env(self):
-        # for keys in settings, we are adding to env
-        for key, value in self.__settings.__dict__.items():
+    def __settings_to_config(self):
+        # for keys in settings, we are adding to the config
+        for key, value in _to_dict(self.__settings).items():
             if value is not None:
-                os.environ[f"config:{key}"] = f"{value}"
+                self.__config[key] = f"{value}"
 
         # also for non Torizon ones
-        for key, value in self.__settings.any.items():
+        for key, value in (self.__settings.any or {}).items():
             if isinstance(value, str) or \
                 isinstance(value, int) or \
                 isinstance(value, float):
 
-                os.environ[f"config:{key}"] = str(value)
+                self.__config[key] = str(value)
+
+        # environment configs
+        if "DOCKER_PSSWD" in self.__environ:
+            self.__config["docker_password"] = self.__environ["DOCKER_PSSWD"]
+
+        # edge case for docker_registry
+        if self.__config.get("docker_registry") == "":
+            self.__config["docker_registry"] = "registry-1.docker.io"
 
 
     def list_labels(self, show_hidden=False, no_index: bool = False):
@@ -482,10 +912,11 @@ class TaskRunner:
 
 
     def desc_input(self, id: str):
-        for _input in self.__inputs:
-            if _input.id == id:
-                print(json.dumps(_input.__dict__, indent=4))
-                return
+        _input = self.__inputs_index.get(id)
+
+        if _input is not None:
+            print(json.dumps(_to_dict(_input), indent=4))
+            return
 
         raise ReferenceError(f"Input with id [{id}] not found")
 
@@ -496,10 +927,7 @@ class TaskRunner:
         if isinstance(label, int):
             task = self.__tasks[label]
         else:
-            for _task in self.__tasks:
-                if _task.label == label:
-                    task = _task
-                    break
+            task = self.__tasks_index.get(label)
 
         if task is not None:
             task_txt = json.dumps(task.to_dict(), indent=4)
@@ -508,166 +936,150 @@ class TaskRunner:
             raise ReferenceError(f"Task with index [{label}] not found")
 
 
-    def __replace_env_var(self, var: str, env: str):
-        if f"${{{var}}}" in env:
-            return env.replace(f"${{{var}}}", os.environ[var])
+    def __resolve_config(self, name: str, raw: str, ctx: TaskContext) -> str:
+        # first check if the config exists
+        if name not in ctx.config:
+            raise ReferenceError(f"Config with id [{raw}] not found. Check your settings.json")
 
-
-    def __check_workspace_folder(self, env: List[str]) -> List[str]:
-        ret: List[str] = []
-
-        for value in env:
-            if "workspaceFolderBasename" in value:
-                value = self.__replace_env_var("workspaceFolderBasename", value)
-            if "workspaceFolder" in value:
-                value = self.__replace_env_var("workspaceFolder", value)
-            ret.append(value)
-
-        return ret
+        return ctx.config[name]
 
 
-    def __check_torizon_inputs(self, env: List[str]) -> List[str]:
-        ret: List[str] = []
+    def __resolve_env(self, name: str, ctx: TaskContext) -> str:
+        if name not in ctx.env:
+            raise ReferenceError(f"Environment variable with id [{name}] not found")
 
-        for value in env:
-            if "${command:torizon_" in value:
-                value = value.replace("${command:torizon_", "${config:torizon_")
-            ret.append(value)
+        return ctx.env[name]
 
-        return ret
 
+    def __resolve_tcb(self, name: str, ctx: TaskContext) -> str:
+        if name == "getNextPackageVersion":
+            _package = self.__resolve_config("tcb_packageName", "tcb.packageName", ctx)
 
-    def __check_docker_inputs(self, env: List[str]) -> List[str]:
-        ret: List[str] = []
+            # the lock also makes parallel tasks wait for the same lookup
+            # instead of asking the platform again
+            with self.__platform_lock:
+                if _package not in self.__next_versions:
+                    from torizon_templates_utils.torizon_io import TorizonPlatform
 
-        for value in env:
-            if "${command:docker_" in value:
-                value = value.replace("${command:docker_", "${config:docker_")
-            ret.append(value)
+                    if self.__platform is None:
+                        self.__platform = TorizonPlatform(ctx.env)
 
-        return ret
+                    _next = self.__platform.package_latest_version(_package) +1
+                    self.__next_versions[_package] = f"{_next}"
 
+                    if self.__debug:
+                        print(f"Next package version: {_next}")
 
-    def __check_tcb_inputs(self, env: List[str]) -> List[str]:
-        ret: List[str] = []
+                return self.__next_versions[_package]
 
-        for value in env:
-            if "${command:tcb" in value:
-                if "tcb.getNextPackageVersion" in value:
-                    # call the xonsh script
-                    _p_ret = subprocess.run(
-                        [
-                            "xonsh",
-                            "./conf/torizon-io.xsh",
-                            "package", "latest", "version",
-                            os.environ["config:tcb_packageName"]
-                        ],
-                        capture_output=True,
-                        text=True
-                    )
-
-                    if _p_ret.returncode != 0:
-                        raise RuntimeError(f"Error running torizon-io.xsh: {_p_ret.stderr}")
-
-                    _next = int(_p_ret.stdout.strip()) +1
+        # outputTEZIFolder
+        # load the tcbuild.yaml
+        import yaml # type: ignore[import-untyped]
 
-                    if self.__debug:
-                        print(f"Next package version: {_next}")
+        with open(os.path.join(self.__cwd, "tcbuild.yaml"), 'r') as file:
+            _tcbuild = yaml.load(file, Loader=yaml.FullLoader)
 
-                    ret.append(
-                        value.replace("${{command:tcb.getNextPackageVersion}}", f"{_next}")
-                    )
+        try:
+            return _tcbuild["output"]["easy-installer"]["local"]
+        except KeyError:
+            raise RuntimeError("Error replacing variable tcb.outputTEZIFolder, make sure the tcbuild.yaml has the output.easy-installer.local property")
 
-                elif "tcb.outputTEZIFolder" in value:
-                    # load the tcbuild.yaml
-                    with open("tcbuild.yaml", 'r') as file:
-                        _tcbuild = yaml.load(file, Loader=yaml.FullLoader)
 
-                        _tezi_folder = None
-                        try:
-                            _tezi_folder = _tcbuild["output"]["easy-installer"]["local"]
-                        except KeyError:
-                            raise RuntimeError("Error replacing variable tcb.outputTEZIFolder, make sure the tcbuild.yaml has the output.easy-installer.local property")
+    def __resolve_input(self, id: str, ctx: TaskContext) -> str:
+        _input = self.__inputs_index.get(id)
+        _input_value = "None"
 
-                        value = value.replace("${{command:tcb.outputTEZIFolder}}", _tezi_folder)
+        if _input is None:
+            raise ReferenceError(f"Input with id [{id}] not found")
 
-                # for all the items we need to replace ${command:tcb. with ${config:tcb.
-                _pattern = r"(?<=\$\{command:tcb\.).*?(?=\s*})"
-                _matches = re.findall(_pattern, value)
+        # first check if the input was set by cli
+        if id in ctx.inputs:
+            return ctx.inputs[id]
+        elif _input.default:
+            return _input.default
 
-                for match in _matches:
-                    value = value.replace(f"${{command:tcb.{match}}}", f"${{config:tcb.{match}}}")
+        if not self.__can_receive_interactive_input:
+            raise RuntimeError("CLI inputs not set and interactive input is disabled")
 
-            ret.append(value)
+        # parallel tasks can not ask for inputs at same time
+        with self.__input_lock:
+            return self.__prompt_input(_input)
 
-        return ret
 
+    def __prompt_input(self, _input: InputOptions) -> str:
+        id = _input.id
+        _input_value = "None"
 
-    def __contains_special_chars(self, str: str) -> bool:
-        _pattern = r"[^a-zA-Z0-9\.\-_|>\/=+&_]"
-        return re.search(_pattern, str) is not None
+        if _input.type == "promptString":
+            _input_value = input(f"{_input.description}: ")
+        elif _input.type == "pickString":
+            # print options
+            assert _input.options is not None, "pickString option has a valid id but options is empty. Check your tasks.json"
+            print(f"Options for [{id}]:")
+            _i = 0
+            _indexed_options = {}
 
+            for _opt in _input.options:
+                _indexed_options[str(_i)] = _opt
+                print(f"{_i}. {_opt}")
+                _i += 1
 
-    def __scape_args(self, args: List[str]) -> List[str]:
-        ret: List[str] = []
+            _input_value = input(f"{_input.description} (option index): ")
 
-        for arg in args:
-            if "\"" in arg:
-                arg = arg.replace("\"", "\\\"")
+            # check if the input is in the options
+            if _input_value not in _indexed_options:
+                raise ValueError(f"Input value for [{id}] is not in the possible options")
+            else:
+                _input_value = _indexed_options[_input_value]
 
-            ret.append(arg)
+        if _input_value is None:
+            raise ValueError(f"Input value for [{id}] could not be None")
 
-        return ret
+        return _input_value
 
 
-    def __check_config(self, args: List[str]) -> List[str]:
+    def __expand(self, value: str, ctx: TaskContext) -> str:
         """
-        This method will make the config replacement in the args
+        Replace the ${...} variables of value in a single pass over the
+        compiled segments of the string.
         """
-        ret: List[str] = []
+        _segments = _compile_variables(value)
 
-        for arg in args:
-            if "${config:" in arg:
-                _pattern = r"(?<=\$\{config:).*?(?=\s*})"
-                _matches = re.findall(_pattern, arg)
+        # nothing to replace, so we can return the string itself
+        if len(_segments) == 1 and isinstance(_segments[0], str):
+            return _segments[0]
 
-                for match in _matches:
-                    if "." in match:
-                        _match = match.replace(".", "_")
-                    else:
-                        _match = match
+        _ret: List[str] = []
 
-                    # first check if the config exists
-                    if f"config:{_match}" not in os.environ:
-                        raise ReferenceError(f"Config with id [{match}] not found. Check your settings.json")
+        for segment in _segments:
+            if isinstance(segment, str):
+                _ret.append(segment)
+                continue
 
-                    # edge case for docker_registry
-                    if _match == "docker_registry" and os.environ[f"config:{_match}"] == "":
-                        os.environ[f"config:{_match}"] = "registry-1.docker.io"
+            kind, name, raw = segment
 
-                    arg = arg.replace(f"${{config:{match}}}", os.environ[f"config:{_match}"])
+            if kind == "config":
+                _ret.append(self.__resolve_config(name, raw, ctx))
+            elif kind == "env":
+                _ret.append(self.__resolve_env(name, ctx))
+            elif kind == "input":
+                _ret.append(self.__resolve_input(name, ctx))
+            elif kind == "tcb":
+                _ret.append(self.__resolve_tcb(name, ctx))
 
-            ret.append(arg)
+        return "".join(_ret)
 
-        return ret
 
+    def __contains_special_chars(self, str: str) -> bool:
+        return _SPECIAL_CHARS_PATTERN.search(str) is not None
 
-    def __check_vscode_env(self, args: List[str]) -> List[str]:
-        """
-        handle the VS Code ${env:VAR} replacement
-        """
+
+    def __scape_args(self, args: List[str]) -> List[str]:
         ret: List[str] = []
 
         for arg in args:
-            if "${env:" in arg:
-                _pattern = r"(?<=\$\{env:).*?(?=\s*})"
-                _matches = re.findall(_pattern, arg)
-
-                for match in _matches:
-                    if match not in os.environ:
-                        raise ReferenceError(f"Environment variable with id [{match}] not found")
-
-                    arg = arg.replace(f"${{env:{match}}}", os.environ[match])
+            if "\"" in arg:
+                arg = arg.replace("\"", "\\\"")
 
             ret.append(arg)
 
@@ -701,89 +1113,17 @@ class TaskRunner:
         return ret
 
 
-    def __check_input(self, args: List[str]) -> List[str]:
-        ret: List[str] = []
-
-        for arg in args:
-            if "${input:" in arg:
-                _pattern = r"(?<=\$\{input:).*?(?=\s*})"
-                _matches = re.findall(_pattern, arg)
-
-                for match in _matches:
-                    _input = None
-                    _input_value = "None"
-
-                    for inp in self.__inputs:
-                        if inp.id == match:
-                            _input = inp
-                            break
-
-                    if _input is None:
-                        raise ReferenceError(f"Input with id [{match}] not found")
-
-                    # first check if the input was set by cli
-                    if match in self.__cli_inputs:
-                        _input_value = self.__cli_inputs[match]
-                    elif _input.default:
-                        _input_value = _input.default
-                    else:
-                        if not self.__can_receive_interactive_input:
-                            raise RuntimeError("CLI inputs not set and interactive input is disabled")
-
-                        if _input.type == "promptString":
-                            _input_value = input(f"{_input.description}: ")
-                        elif _input.type == "pickString":
-                            for _inp in self.__inputs:
-                                if _inp.id == match:
-                                    # print options
-                                    assert _inp.options is not None, "pickString option has a valid id but options is empty. Check your tasks.json"
-                                    print(f"Options for [{match}]:")
-                                    _i = 0
-                                    _indexed_options = {}
-
-                                    for _opt in _inp.options:
-                                        _indexed_options[str(_i)] = _opt
-                                        print(f"{_i}. {_opt}")
-                                        _i += 1
-
-                                    _input_value = input(f"{_input.description} (option index): ")
-
-                                    # check if the input is in the options
-                                    if _input_value not in _indexed_options:
-                                        raise ValueError(f"Input value for [{match}] is not in the possible options")
-                                    else:
-                                        _input_value = _indexed_options[_input_value]
-
-                        if _input_value is None:
-                            raise ValueError(f"Input value for [{match}] could not be None")
-
-                    arg = arg.replace(f"${{input:{match}}}", _input_value)
-
-            ret.append(arg)
-
-        return ret
-
-
-    def __parse_envs(self, env: str, task: TaskDescription) -> str | None :
+    def __parse_envs(
+            self, env: str, task: TaskDescription, ctx: TaskContext
+        ) -> str | None :
         """
         It's christmas time 🎅
         """
-        if task.options:
-            value = task.options.env
-
-            # get the env from the task
-            if value:
-                _env_value = value.get(env)
+        if task.options and task.options.env:
+            _env_value = task.options.env.get(env)
 
             if _env_value:
-                expvalue = [_env_value]
-                expvalue = self.__check_workspace_folder(expvalue)
-                expvalue = self.__check_torizon_inputs(expvalue)
-                expvalue = self.__check_docker_inputs(expvalue)
-                expvalue = self.__check_tcb_inputs(expvalue)
-                expvalue = self.__check_input(expvalue)
-                expvalue = self.__check_config(expvalue)
-                exp_value_str = " ".join(expvalue)
+                exp_value_str = self.__expand(_env_value, ctx)
 
                 if self.__debug:
                     print(f"Env: {env}={_env_value}")
@@ -807,8 +1147,7 @@ class TaskRunner:
         """
         for key, value in cli_inputs.items():
             # validate if the key is in the inputs
-            _input = None
-            _input = next((inp for inp in self.__inputs if inp.id == key), None)
+            _input = self.__inputs_index.get(key)
 
             if _input is None:
                 raise ReferenceError(f"Input with id [{key}] not found")
@@ -816,63 +1155,462 @@ class TaskRunner:
             self.__cli_inputs[key] = value
 
 
-    def run_task(self, label: str) -> None:
-        # query the task
-        _task = None
-        _task = next((task for task in self.__tasks if task.label == label), None)
+    def __get_task(self, label: str) -> TaskDescription:
+        _task = self.__tasks_index.get(label)
 
         if _task is None:
             raise ReferenceError(f"Task with label [{label}] not found")
 
-        # prepare the command
-        _cmd = _task.command
+        return _task
 
-        # the cmd itself can use the mechanism to replace stuff
-        _cmd = self.__check_workspace_folder([_cmd])[0]
-        _cmd = self.__check_torizon_inputs([_cmd])[0]
-        _cmd = self.__check_docker_inputs([_cmd])[0]
-        _cmd = self.__check_tcb_inputs([_cmd])[0]
-        _cmd = self.__check_input([_cmd])[0]
-        _cmd = self.__check_vscode_env([_cmd])[0]
-        _cmd = self.__check_config([_cmd])[0]
 
-        _args = []
-        if _task.args is not None:
-            _args = _task.args
+    def __check_cycles(self, label: str) -> List[str]:
+        """
+        Walk the dependsOn graph of the task [label] and raise if there is
+        a circular dependency, before anything is executed. Returns the
+        labels of the tree in a valid execution order.
+        """
+        _done: set = set()
+        _path: List[str] = []
+        _order: List[str] = []
 
-        _env: Dict[str, str] | None = {}
-        _cwd = None
-        _last_cwd = os.getcwd()
-        if _task.options is not None:
-            _env = _task.options.env
-            _cwd = _task.options.cwd
+        def _visit(_label: str):
+            if _label in _done:
+                return
 
-        _depends = []
-        if _task.dependsOn is not None:
-            _depends = _task.dependsOn
+            if _label in _path:
+                _cycle = _path[_path.index(_label):] + [_label]
+                raise ValueError(
+                    f"Circular dependency detected: {' -> '.join(_cycle)}"
+                )
 
-        # first we need to run the dependencies
-        for dep in _depends:
-            self.run_task(dep)
+            _path.append(_label)
 
-        print(f"> Executing task: {label} <", color=Color.GREEN)
+            for dep in (self.__get_task(_label).dependsOn or []):
+                _visit(dep)
+
+            _path.pop()
+            _done.add(_label)
+            _order.append(_label)
+
+        _visit(label)
+
+        return _order
+
+
+    def __schedule(
+            self,
+            label: str,
+            pool: ThreadPoolExecutor,
+            scheduled: Dict[str, Future]
+        ) -> Future:
+        """
+        Return the future that is resolved when the task [label] and all its
+        dependencies are done. Each label is scheduled only once per
+        run_task invocation, so shared dependencies are executed once.
+        """
+        from concurrent.futures import Future
+
+        with self.__schedule_lock:
+            if label in scheduled:
+                return scheduled[label]
+
+            _done: Future = Future()
+            scheduled[label] = _done
+
+        _task = self.__get_task(label)
+        _depends = _task.dependsOn if _task.dependsOn is not None else []
+
+        def _propagate(fut: Future):
+            if fut.exception() is not None:
+                _done.set_exception(fut.exception())
+            else:
+                _done.set_result(None)
+
+        def _run_self():
+            if self.__failed:
+                _done.set_exception(
+                    RuntimeError(f"Task [{label}] skipped, a previous task failed")
+                )
+                return
+
+            pool.submit(self.__execute_task, _task).add_done_callback(_propagate)
+
+        # dependsOrder parallel, all the dependencies can start at once
+        # and the task itself runs when the last one is done
+        if _task.dependsOrder == "parallel" and len(_depends) > 0:
+            _deps_futures = [
+                self.__schedule(dep, pool, scheduled) for dep in _depends
+            ]
+            _pending = [len(_deps_futures)]
+            _pending_lock = threading.Lock()
+
+            def _dep_done(fut: Future):
+                with _pending_lock:
+                    _pending[0] -= 1
+                    _last = _pending[0] == 0
+
+                if not _last:
+                    return
+
+                for _fut in _deps_futures:
+                    if _fut.exception() is not None:
+                        _done.set_exception(_fut.exception())
+                        return
+
+                _run_self()
+
+            for _fut in _deps_futures:
+                _fut.add_done_callback(_dep_done)
+
+        # dependsOrder sequence, the next dependency is only scheduled
+        # when the previous one is done
+        else:
+            def _next(ix: int):
+                if ix == len(_depends):
+                    _run_self()
+                    return
+
+                def _dep_done(fut: Future):
+                    if fut.exception() is not None:
+                        _done.set_exception(fut.exception())
+                    else:
+                        _next(ix + 1)
+
+                self.__schedule(_depends[ix], pool, scheduled).add_done_callback(_dep_done)
+
+            _next(0)
+
+        return _done
+
+
+    def run_task(
+            self, label: str, force: bool = False, profile: bool = False
+        ) -> None:
+        """
+        Run the task [label] and its dependsOn tree. Tasks shared by
+        multiple branches run only once, and dependencies of tasks with
+        dependsOrder parallel are executed concurrently.
+        Tasks that declare inputs are skipped when they are up to date,
+        unless force is set.
+        With profile set (or TASKS_PROFILE) the output of the tasks is
+        tagged with the task label and a timing report and trace file are
+        generated at the end.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from torizon_templates_utils.profiling import TaskProfiler
+
+        # fail fast if the tree has unknown labels or cycles
+        self.__check_cycles(label)
+
+        self.__failed = False
+        self.__force = force
+        self.__profiler = None
+        self.__next_versions = {}
+        _scheduled: Dict[str, Future] = {}
+
+        if profile or "TASKS_PROFILE" in self.__environ:
+            self.__profiler = TaskProfiler()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.__max_parallel) as pool:
+                _root = self.__schedule(label, pool, _scheduled)
+
+                # this will raise the first error found on the tree
+                _root.result()
+        finally:
+            # keep the state of the tasks that succeeded even on errors
+            self.__save_state()
+
+            if self.__profiler is not None:
+                self.__report_profile(label)
+
+
+    def __predecessors(self, label: str) -> Dict[str, List[str]]:
+        """
+        For each task of the tree, the tasks that need to be done before it
+        starts: its dependsOn and, for dependsOrder sequence, the dependency
+        that comes before it on the parent task.
+        """
+        _preds: Dict[str, List[str]] = {}
+
+        for _label in self.__check_cycles(label):
+            _task = self.__get_task(_label)
+            _depends = _task.dependsOn if _task.dependsOn is not None else []
+            _preds.setdefault(_label, []).extend(_depends)
+
+            if _task.dependsOrder != "parallel":
+                for ix in range(1, len(_depends)):
+                    _preds.setdefault(_depends[ix], []).append(_depends[ix -1])
+
+        return _preds
+
+
+    def __report_profile(self, label: str) -> None:
+        assert self.__profiler is not None
+
+        self.__profiler.print_report(label, self.__predecessors(label))
+
+        _trace_path = os.path.join(self.__cwd, _CACHE_FOLDER, "tasks-trace.json")
+
+        try:
+            self.__profiler.write_trace(_trace_path)
+            print(f"Trace written to {_trace_path}", color=Color.BLUE)
+        except OSError as ex:
+            print(f"Could not write the trace: {ex}", color=Color.YELLOW)
+
+
+    def explain_task(self, label: str) -> None:
+        """
+        Show, for each task of the dependsOn tree of [label], if it would
+        run or be skipped and why.
+        """
+        for _label in self.__check_cycles(label):
+            _task = self.__get_task(_label)
+
+            if _task.inputs is None:
+                print(f"{_label}: run, no inputs declared")
+                continue
+
+            _ctx = self.__create_context(_task)
+            _fingerprint = self.__fingerprint(_task, _ctx, self.__resolve_command(_task, _ctx))
+            _reason = self.__outdated_reason(_task, _ctx, _fingerprint)
+
+            if _reason is None:
+                print(f"{_label}: skip, up to date", color=Color.GREEN)
+            else:
+                print(f"{_label}: run, {_reason}", color=Color.YELLOW)
+
+
+    def __state_path(self) -> str:
+        return os.path.join(self.__cwd, _CACHE_FOLDER, "tasks-state.json")
+
+
+    def __load_state(self) -> Dict:
+        with self.__state_lock:
+            if self.__state is not None:
+                return self.__state
+
+            _state = None
+
+            try:
+                with open(self.__state_path(), 'r') as file:
+                    _state = json.load(file)
+
+                if _state.get("version") != _CACHE_VERSION:
+                    _state = None
+            except (OSError, ValueError):
+                pass
+
+            if _state is None:
+                _state = { "version": _CACHE_VERSION, "files": {}, "tasks": {} }
+
+            self.__state = _state
+            self.__file_hashes = FileHashCache(_state["files"])
+
+            return _state
+
+
+    def __save_state(self) -> None:
+        with self.__state_lock:
+            if self.__state is None:
+                return
+
+            try:
+                os.makedirs(os.path.dirname(self.__state_path()), exist_ok=True)
+
+                _tmp_path = f"{self.__state_path()}.{os.getpid()}.tmp"
+                with open(_tmp_path, 'w') as file:
+                    json.dump(self.__state, file)
+
+                os.replace(_tmp_path, self.__state_path())
+            except OSError:
+                # the state is only an optimization
+                pass
+
+
+    def __glob_files(self, patterns: List[str], ctx: TaskContext) -> Tuple[List[str], List[str]]:
+        """
+        Expand the files or globs, relative to the task cwd. Directories are
+        expanded to all the files inside them. Returns the files found and
+        the patterns that did not match anything.
+        """
+        import glob
+
+        _files: set = set()
+        _missing: List[str] = []
+
+        for pattern in patterns:
+            _pattern = os.path.join(ctx.cwd, self.__expand(pattern, ctx))
+            _matches = glob.glob(_pattern, recursive=True)
+
+            if len(_matches) == 0:
+                _missing.append(pattern)
+
+            for match in _matches:
+                if os.path.isdir(match):
+                    for root, _, files in os.walk(match):
+                        _files.update(os.path.join(root, file) for file in files)
+                else:
+                    _files.add(match)
+
+        return sorted(_files), _missing
+
+
+    def __fingerprint(
+            self, task: TaskDescription, ctx: TaskContext, cmd: str | List[str]
+        ) -> Dict:
+        """
+        Fingerprint of the task, the hash of the resolved command, env and
+        cwd plus the hash of each input file.
+        """
+        self.__load_state()
+        assert self.__file_hashes is not None
+
+        _command = hashlib.sha256()
+        _command.update(json.dumps(cmd).encode())
+        _command.update(ctx.cwd.encode())
+
+        if task.options is not None and task.options.env is not None:
+            for env in sorted(task.options.env.keys()):
+                _command.update(f"{env}={ctx.env.get(env, '')}".encode())
+
+        _files, _ = self.__glob_files(task.inputs or [], ctx)
+
+        return {
+            "command": _command.hexdigest(),
+            "files": self.__file_hashes.hash_files(_files)
+        }
+
+
+    def __outdated_reason(
+            self, task: TaskDescription, ctx: TaskContext, fingerprint: Dict
+        ) -> Optional[str]:
+        """
+        Return why the task needs to run, or None if it is up to date.
+        """
+        _state = self.__load_state()
+        _last = _state["tasks"].get(task.label)
+
+        if _last is None:
+            return "no successful run recorded"
+
+        if _last["command"] != fingerprint["command"]:
+            return "command, args, env or cwd changed"
+
+        _changed = [
+            file for file, _hash in fingerprint["files"].items()
+            if _last["files"].get(file) != _hash
+        ]
+        _removed = [
+            file for file in _last["files"].keys()
+            if file not in fingerprint["files"]
+        ]
+
+        if len(_changed) > 0 or len(_removed) > 0:
+            _files = [os.path.relpath(file, self.__cwd) for file in _changed + _removed]
+            return f"inputs changed: {', '.join(_files)}"
+
+        _outputs, _missing = self.__glob_files(task.outputs or [], ctx)
+
+        if len(_missing) > 0:
+            return f"outputs missing: {', '.join(_missing)}"
+
+        assert self.__file_hashes is not None
+        if self.__file_hashes.hash_files(_outputs) != _last["outputs"]:
+            return "outputs changed since the last run"
+
+        return None
+
+
+    def __record_success(
+            self, task: TaskDescription, ctx: TaskContext, fingerprint: Dict
+        ) -> None:
+        _state = self.__load_state()
+        _outputs, _ = self.__glob_files(task.outputs or [], ctx)
+
+        assert self.__file_hashes is not None
+        fingerprint["outputs"] = self.__file_hashes.hash_files(_outputs)
+
+        with self.__state_lock:
+            _state["tasks"][task.label] = fingerprint
+
+
+    def __execute_task(self, task: TaskDescription) -> None:
+        # tasks already queued when another branch failed are not executed
+        if self.__failed:
+            raise RuntimeError(f"Task [{task.label}] skipped, a previous task failed")
+
+        try:
+            self.__execute_task_unsafe(task)
+        except BaseException:
+            self.__failed = True
+            raise
+
+
+    def __create_context(self, task: TaskDescription) -> TaskContext:
+        """
+        Create the context of the task, with the task env values on top of
+        the base environment and the resolved cwd.
+        """
+        _ctx = TaskContext(
+            config=self.__config,
+            inputs=self.__cli_inputs,
+            env=self.__environ,
+            cwd=self.__cwd
+        )
+
+        if task.options is None:
+            return _ctx
+
+        # the env values are resolved against the base environment
+        _env_overlay: Dict[str, str] = {}
+
+        if task.options.env is not None:
+            for env in task.options.env.keys():
+                if self.__override_env or env not in self.__environ:
+                    __env = self.__parse_envs(env, task, _ctx)
+                    if __env:
+                        _env_overlay[env] = __env
+
+        if len(_env_overlay) > 0:
+            _ctx.env = {**self.__environ, **_env_overlay}
+
+        if task.options.cwd is not None:
+            _ctx.cwd = os.path.join(
+                self.__cwd, self.__expand(task.options.cwd, _ctx)
+            )
+
+        return _ctx
+
+
+    def __resolve_command(
+            self, task: TaskDescription, ctx: TaskContext
+        ) -> str | List[str]:
+        """
+        Resolve the command and args of the task to what is executed, the
+        command line for shell tasks or the argv for process tasks.
+        """
+        # prepare the command
+        _cmd = task.command
+
+        # the cmd itself can use the mechanism to replace stuff
+        _cmd = self.__expand(_cmd, ctx)
+
+        _args = []
+        if task.args is not None:
+            _args = task.args
 
         _is_background = ""
-        if _task.isBackground:
+        if task.isBackground:
             _is_background = " &"
 
-        _shell = _task.type == "shell"
+        _shell = task.type == "shell"
 
         # FIXME:    The scape args was in the powershell implementation
         #           but when used on Python it generates weird behavior
         # _args = self.__scape_args(_args)
-        _args = self.__check_workspace_folder(_args)
-        _args = self.__check_torizon_inputs(_args)
-        _args = self.__check_docker_inputs(_args)
-        _args = self.__check_tcb_inputs(_args)
-        _args = self.__check_input(_args)
-        _args = self.__check_vscode_env(_args)
-        _args = self.__check_config(_args)
+        _args = [self.__expand(arg, ctx) for arg in _args]
         _args = self.__check_long_args(_args)
         _args = self.__quoting_special_chars(_args)
 
@@ -880,48 +1618,100 @@ class TaskRunner:
         if self.__gitlab_ci:
             _cmd = self.__replace_docker_host(_cmd)
 
-        # inject env
-        if _env is not None:
-            for env, value in _env.items():
-                if self.__override_env:
-                    __env = self.__parse_envs(env, _task)
-                    if __env:
-                        os.environ[env] = __env
-                else:
-                    if env not in os.environ:
-                        __env = self.__parse_envs(env, _task)
-                        if __env:
-                            os.environ[env] = __env
-
-        # we need to change the cwd if it's set
-        if _cwd is not None:
-            _cwd = self.__check_workspace_folder([_cwd])[0]
-            _cwd = self.__check_config([_cwd])[0]
-            _cwd = self.__check_vscode_env([_cwd])[0]
-
-            os.chdir(_cwd)
-
-        # execute the task
         _cmd_join = f"{_cmd} {' '.join(_args)}{_is_background}"
 
         if self.__debug:
-            print(f"Command: {_task.command}", color=Color.YELLOW)
-            print(f"Args: {_task.args}", color=Color.YELLOW)
+            print(f"Command: {task.command}", color=Color.YELLOW)
+            print(f"Args: {task.args}", color=Color.YELLOW)
             print(f"Parsed Args: {_args}", color=Color.YELLOW)
             print(f"Parsed Command: {_cmd_join}", color=Color.YELLOW)
+            print(f"Cwd: {ctx.cwd}", color=Color.YELLOW)
 
-        _ret = subprocess.run(
-            [_cmd, *_args] if not _shell else _cmd_join,
-            stdout=None,
-            stderr=None,
-            env=os.environ,
-            shell=_shell
-        )
+        return [_cmd, *_args] if not _shell else _cmd_join
+
+
+    def __execute_task_unsafe(self, task: TaskDescription) -> None:
+        label = task.label
+        _start = self.__profiler.now() if self.__profiler is not None else 0
+        _ctx = self.__create_context(task)
+        _cmd = self.__resolve_command(task, _ctx)
 
-        # go back to the last cwd
-        os.chdir(_last_cwd)
+        # incremental tasks, skip if nothing changed since the last run
+        _fingerprint = None
+        if task.inputs is not None:
+            _fingerprint = self.__fingerprint(task, _ctx, _cmd)
 
-        if _ret.returncode != 0:
-            print(f"> TASK [{label}] exited with error code [{_ret.returncode}] <", color=Color.RED)
+            if not self.__force and \
+                self.__outdated_reason(task, _ctx, _fingerprint) is None:
+
+                print(f"> Skipping task: {label} (up to date) <", color=Color.BLUE)
+
+                if self.__profiler is not None:
+                    self.__profiler.record(label, _start, skipped=True)
+
+                return
+
+        print(f"> Executing task: {label} <", color=Color.GREEN)
+
+        # execute the task
+        if self.__profiler is not None:
+            _returncode = self.__run_profiled(task, _cmd, _ctx, _start)
+        else:
+            _returncode = subprocess.run(
+                _cmd,
+                stdout=None,
+                stderr=None,
+                env=_ctx.env,
+                cwd=_ctx.cwd,
+                shell=isinstance(_cmd, str)
+            ).returncode
+
+        if _returncode != 0:
+            print(f"> TASK [{label}] exited with error code [{_returncode}] <", color=Color.RED)
             raise RuntimeError(f"Error running task: {label}")
 
+        if _fingerprint is not None:
+            self.__record_success(task, _ctx, _fingerprint)
+
+
+    def __run_profiled(
+            self,
+            task: TaskDescription,
+            cmd: str | List[str],
+            ctx: TaskContext,
+            start: float
+        ) -> int:
+        """
+        Run the task streaming its output through the profiler, and record
+        the wall time, cpu time and exit code of the process.
+        """
+        assert self.__profiler is not None
+
+        # background tasks keep the output open after the shell returns,
+        # so they can not be streamed
+        _stream = not task.isBackground
+
+        _proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE if _stream else None,
+            stderr=subprocess.STDOUT if _stream else None,
+            env=ctx.env,
+            cwd=ctx.cwd,
+            shell=isinstance(cmd, str)
+        )
+
+        if _proc.stdout is not None:
+            self.__profiler.stream(task.label, _proc.stdout)
+
+        # wait4 also gives the resource usage of this specific child
+        _, _status, _usage = os.wait4(_proc.pid, 0)
+        _proc.returncode = os.waitstatus_to_exitcode(_status)
+
+        self.__profiler.record(
+            task.label,
+            start,
+            cpu=_usage.ru_utime + _usage.ru_stime,
+            exit_code=_proc.returncode
+        )
+
+        return _proc.returncode
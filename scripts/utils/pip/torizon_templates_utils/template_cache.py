@@ -0,0 +1,153 @@
+
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional
+
+# bump it when the content of the prepared templates changes
+_CACHE_VERSION = 1
+
+
+def _cache_dir() -> str:
+    _cache_home = os.environ.get(
+        "XDG_CACHE_HOME",
+        os.path.join(os.path.expanduser("~"), ".cache")
+    )
+
+    return os.path.join(_cache_home, "torizon-templates", "prepared")
+
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r') as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def templates_commit(templates_root: str) -> Optional[str]:
+    """
+    Commit checked out on the templates repository on [templates_root], or
+    None if it is not a git repository. The git files are read directly,
+    running git would cost more than preparing the template.
+    """
+    _git_dir = os.path.join(templates_root, ".git")
+
+    # worktrees and submodules have a file pointing to the git dir
+    if os.path.isfile(_git_dir):
+        _link = _read_text(_git_dir)
+
+        if _link is None or not _link.startswith("gitdir:"):
+            return None
+
+        _git_dir = os.path.join(templates_root, _link[len("gitdir:"):].strip())
+
+    _head = _read_text(os.path.join(_git_dir, "HEAD"))
+
+    if _head is None:
+        return None
+
+    if not _head.startswith("ref:"):
+        # detached head
+        return _head
+
+    _ref = _head[len("ref:"):].strip()
+    _commit = _read_text(os.path.join(_git_dir, _ref))
+
+    if _commit is not None:
+        return _commit
+
+    # the refs can also be packed, worktrees share them with the main repo
+    _common_dir = _read_text(os.path.join(_git_dir, "commondir"))
+
+    if _common_dir is not None:
+        _git_dir = os.path.join(_git_dir, _common_dir)
+        _commit = _read_text(os.path.join(_git_dir, _ref))
+
+        if _commit is not None:
+            return _commit
+
+    _packed_refs = _read_text(os.path.join(_git_dir, "packed-refs"))
+
+    if _packed_refs is None:
+        return None
+
+    for line in _packed_refs.splitlines():
+        _parts = line.split(" ")
+
+        if len(_parts) == 2 and _parts[1] == _ref:
+            return _parts[0]
+
+    return None
+
+
+def _stamp(path: str) -> List[int]:
+    try:
+        _stat = os.stat(path)
+        return [_stat.st_mtime_ns, _stat.st_size]
+    except FileNotFoundError:
+        return []
+
+
+class PreparedTemplateCache:
+    """
+    PreparedTemplateCache keeps what creating a project from a template
+    needs from the templates repository, as the merged tasks.json and the
+    pruned torizonPackages.json, so it is not prepared again on each project
+    creation. The entries are keyed by the commit of the templates
+    repository, the template folder and name, and the mtime and size of the
+    [inputs] files, so updating the repository or editing the files
+    invalidates them.
+    """
+
+    def __init__(
+            self,
+            templates_root: str,
+            template_folder: str,
+            template: str,
+            inputs: List[str]
+        ):
+        self.__path: Optional[str] = None
+
+        if os.environ.get("TEMPLATES_DISABLE_PREPARED_CACHE"):
+            return
+
+        _templates_root = os.path.realpath(templates_root)
+
+        _key = hashlib.sha256(json.dumps([
+            _CACHE_VERSION,
+            templates_commit(_templates_root),
+            os.path.realpath(template_folder),
+            template,
+            [_stamp(path) for path in inputs]
+        ]).encode()).hexdigest()
+
+        self.__path = os.path.join(_cache_dir(), f"{_key}.json")
+
+
+    def load(self) -> Optional[Dict]:
+        if self.__path is None:
+            return None
+
+        try:
+            with open(self.__path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+
+    def store(self, prepared: Dict) -> None:
+        if self.__path is None:
+            return
+
+        # the cache is an optimization, failing to write it is not an error
+        try:
+            os.makedirs(os.path.dirname(self.__path), exist_ok=True)
+            _tmp_path = f"{self.__path}.{os.getpid()}.tmp"
+
+            with open(_tmp_path, 'w') as file:
+                json.dump(prepared, file)
+
+            os.replace(_tmp_path, self.__path)
+        except OSError:
+            pass
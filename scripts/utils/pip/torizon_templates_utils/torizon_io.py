@@ -0,0 +1,651 @@
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+from torizon_templates_utils.hashing import sha256_file
+
+# torizon_io_api and requests are heavy to import, so they are imported only
+# when the platform is really used
+
+_API_HOST = "https://app.torizon.io/api/v2beta"
+_TOKEN_URL = "https://kc.torizon.io/auth/realms/ota-users/protocol/openid-connect/token"
+# tokens are not used on the last seconds of their life, a request can be
+# in flight while it expires
+_TOKEN_EXPIRY_MARGIN = 30
+_TOKEN_DEFAULT_TTL = 300
+# the listings are always paginated, the account can have thousands of
+# packages
+_PAGE_SIZE = 50
+# the upload endpoint has no resumable uploads, so failed uploads are sent
+# again from the start, waiting 1s, 2s, 4s ... between the attempts
+_UPLOAD_RETRIES = 4
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# progress(sent bytes, total bytes, bytes per second)
+ProgressCallback = Callable[[int, int, float], None]
+
+
+def _cache_dir() -> str:
+    _cache_home = os.environ.get(
+        "XDG_CACHE_HOME",
+        os.path.join(os.path.expanduser("~"), ".cache")
+    )
+
+    return os.path.join(_cache_home, "torizon-templates")
+
+
+def _read_private_json(path: str) -> Optional[Dict]:
+    """
+    Returns the content of the json file, or None if it does not exist, is
+    invalid or is not private to the current user.
+    """
+    try:
+        _fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return None
+
+    with os.fdopen(_fd, 'r') as file:
+        _stat = os.fstat(file.fileno())
+
+        if _stat.st_uid != os.getuid() or _stat.st_mode & 0o077:
+            return None
+
+        try:
+            return json.load(file)
+        except ValueError:
+            return None
+
+
+def _write_private_json(path: str, data: Dict) -> None:
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    _tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    # created already private, the token is never readable by others
+    _fd = os.open(_tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+
+    with os.fdopen(_fd, 'w') as file:
+        json.dump(data, file)
+
+    os.replace(_tmp_path, path)
+
+
+class _UploadReader:
+    """
+    File like object that streams the file to the upload request, reading
+    it in chunks so the memory used does not depend on the file size, and
+    reporting the progress.
+    """
+
+    def __init__(
+            self,
+            file: IO[bytes],
+            total: int,
+            progress: Optional[ProgressCallback]
+        ):
+
+        self.__file = file
+        self.__total = total
+        self.__progress = progress
+        self.__sent = 0
+        self.__start = time.monotonic()
+
+
+    def __len__(self) -> int:
+        return self.__total
+
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > _UPLOAD_CHUNK_SIZE:
+            size = _UPLOAD_CHUNK_SIZE
+
+        _chunk = self.__file.read(size)
+        self.__sent += len(_chunk)
+
+        if self.__progress is not None and len(_chunk) > 0:
+            _elapsed = max(time.monotonic() - self.__start, 1e-6)
+            self.__progress(self.__sent, self.__total, self.__sent / _elapsed)
+
+        return _chunk
+
+
+class TorizonPlatform:
+    """
+    TorizonPlatform is the client of the Torizon Cloud API used by the
+    torizon-io.xsh script and by the TaskRunner, to resolve the tcb commands.
+    The credentials are read from PLATFORM_CLIENT_ID and
+    PLATFORM_CLIENT_SECRET, and the hosts can be changed with
+    PLATFORM_API_HOST and PLATFORM_TOKEN_URL.
+    The access token is cached on $XDG_CACHE_HOME/torizon-templates, private
+    to the user, until it expires, so back to back invocations login only
+    once. PLATFORM_DISABLE_TOKEN_CACHE disables it. All the requests of the
+    instance share the same pooled api client.
+    The latest version and hash of each package are kept on a local index,
+    so only the versions pushed since the last query are listed.
+    PLATFORM_DISABLE_PACKAGE_INDEX disables it.
+    """
+
+    def __init__(self, environ: Optional[Dict[str, str]] = None):
+        _environ = environ if environ is not None else os.environ
+
+        if "PLATFORM_CLIENT_ID" not in _environ:
+            raise ValueError("Environment variable PLATFORM_CLIENT_ID not set")
+
+        if "PLATFORM_CLIENT_SECRET" not in _environ:
+            raise ValueError("Environment variable PLATFORM_CLIENT_SECRET not set")
+
+        self.__client_id = _environ["PLATFORM_CLIENT_ID"]
+        self.__client_secret = _environ["PLATFORM_CLIENT_SECRET"]
+        self.__api_host = _environ.get("PLATFORM_API_HOST", _API_HOST)
+        self.__token_url = _environ.get("PLATFORM_TOKEN_URL", _TOKEN_URL)
+        self.__cache_token = "PLATFORM_DISABLE_TOKEN_CACHE" not in _environ
+        self.__use_index = "PLATFORM_DISABLE_PACKAGE_INDEX" not in _environ
+        self.__client = None
+        self.__lock = threading.Lock()
+        self.__index: Optional[Dict[str, Dict]] = None
+        self.__index_lock = threading.Lock()
+
+        # one cache file per credentials and token endpoint
+        _key = hashlib.sha256(
+            f"{self.__token_url}\0{self.__client_id}\0{self.__client_secret}".encode()
+        ).hexdigest()
+        self.__token_cache_path = os.path.join(
+            _cache_dir(), f"platform-token-{_key[:16]}.json"
+        )
+
+        # and one package index per account
+        _key = hashlib.sha256(
+            f"{self.__api_host}\0{self.__client_id}".encode()
+        ).hexdigest()
+        self.__index_path = os.path.join(
+            _cache_dir(), f"platform-index-{_key[:16]}.json"
+        )
+
+
+    def __get_jon_oster_token(self) -> Tuple[str, int]:
+        import requests
+
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+
+        payload = {
+            "grant_type": "client_credentials",
+            "client_id": self.__client_id,
+            "client_secret": self.__client_secret
+        }
+
+        response = requests.post(
+            self.__token_url,
+            headers=headers,
+            data=payload
+        )
+
+        response.raise_for_status()
+
+        # and we have the AWESOME Jon Oster Token 🦪
+        _json = response.json()
+
+        return (
+            _json.get("access_token"),
+            int(_json.get("expires_in", _TOKEN_DEFAULT_TTL))
+        )
+
+
+    def __token(self, refresh: bool = False) -> str:
+        if self.__cache_token and not refresh:
+            _cache = _read_private_json(self.__token_cache_path)
+
+            if _cache is not None and \
+                _cache.get("expires_at", 0) - _TOKEN_EXPIRY_MARGIN > time.time():
+
+                return _cache["access_token"]
+
+        _token, _expires_in = self.__get_jon_oster_token()
+
+        if self.__cache_token:
+            try:
+                _write_private_json(self.__token_cache_path, {
+                    "access_token": _token,
+                    "expires_at": time.time() + _expires_in
+                })
+            except OSError:
+                # the cache is an optimization, not being able to write it
+                # should not break the command
+                pass
+
+        return _token
+
+
+    def __api_client(self):
+        import torizon_io_api as torizon_cloud
+
+        # the login is done only on the first request
+        with self.__lock:
+            if self.__client is None:
+                self.__client = torizon_cloud.ApiClient(
+                    torizon_cloud.Configuration(
+                        host = self.__api_host,
+                        access_token = self.__token()
+                    )
+                )
+
+        return self.__client
+
+
+    def __call(self, func: Callable):
+        """
+        Call func with the shared api client. If the token was revoked before
+        it expired the login is done again and func is retried once.
+        """
+        from torizon_io_api.exceptions import UnauthorizedException
+
+        _client = self.__api_client()
+
+        try:
+            return func(_client)
+        except UnauthorizedException:
+            with self.__lock:
+                _client.configuration.access_token = self.__token(refresh=True)
+
+            return func(_client)
+
+
+    def __paginate(self, fetch: Callable) -> Iterator:
+        """
+        Iterate over the values of a paginated listing, requesting the next
+        page only when the values of the current one were consumed, so the
+        callers can stop early. fetch is called with the api client, the
+        offset and the limit.
+        """
+        _offset = 0
+
+        while True:
+            _page = self.__call(
+                lambda client: fetch(client, _offset, _PAGE_SIZE)
+            )
+            _values = _page.values or []
+
+            yield from _values
+
+            _offset += len(_values)
+
+            if len(_values) == 0 or _offset >= _page.total:
+                return
+
+
+    def get_target_by_hash(self, _hash: str):
+        import torizon_io_api as torizon_cloud
+
+        _packages = self.__call(
+            lambda client: torizon_cloud.PackagesApi(client).get_packages(
+                limit=1,
+                hashes=[_hash]
+            )
+        )
+
+        if _packages.total == 0 or not _packages.values:
+            raise ReferenceError(f"Package with hash {_hash} not found")
+
+        return _packages.values.pop()
+
+
+    def get_fleet_ids(self, fleet_names: List[str]) -> Dict:
+        """
+        Returns the id of each fleet of [fleet_names], with a single listing
+        that stops when all of them were found.
+        """
+        import torizon_io_api as torizon_cloud
+
+        _missing = set(fleet_names)
+        _ids = {}
+
+        for fleet in self.__paginate(
+            lambda client, offset, limit: torizon_cloud.FleetsApi(client).get_fleets(
+                offset=offset,
+                limit=limit
+            )
+        ):
+            if fleet.name in _missing:
+                _ids[fleet.name] = fleet.id
+                _missing.remove(fleet.name)
+
+                if len(_missing) == 0:
+                    return _ids
+
+        raise ReferenceError(f"Fleet {', '.join(sorted(_missing))} not found")
+
+
+    def get_fleet_id(self, fleet_name: str):
+        return self.get_fleet_ids([fleet_name])[fleet_name]
+
+
+    def get_fleet_devices(self, fleet_name: str) -> List:
+        import torizon_io_api as torizon_cloud
+
+        _fleet_id = self.get_fleet_id(fleet_name)
+
+        return list(self.__paginate(
+            lambda client, offset, limit: torizon_cloud.FleetsApi(client).get_fleets_fleetid_devices(
+                fleet_id=_fleet_id,
+                offset=offset,
+                limit=limit
+            )
+        ))
+
+
+    def __load_index(self) -> Dict[str, Dict]:
+        if self.__index is None:
+            _index = _read_private_json(self.__index_path) if self.__use_index else None
+            self.__index = _index if _index is not None else {}
+
+        return self.__index
+
+
+    def __update_index(self, package_name: str, entry: Optional[Dict]) -> None:
+        _index = self.__load_index()
+
+        if entry is None:
+            _index.pop(package_name, None)
+        else:
+            _index[package_name] = entry
+
+        if self.__use_index:
+            try:
+                _write_private_json(self.__index_path, _index)
+            except OSError:
+                pass
+
+
+    def package_latest(self, package_name: str) -> Dict:
+        """
+        Returns the hash, version and package id of the latest version
+        pushed of the package [package_name]. If the package was never
+        pushed the hash and package id are None and the version is 0.
+        """
+        import torizon_io_api as torizon_cloud
+
+        with self.__index_lock:
+            # newest first, so the listing can stop on the package that is
+            # already on the index, all the older ones were seen before.
+            # Without the index only the newest page is checked, the
+            # versions are pushed incrementing the latest one, so the latest
+            # version is one of the last pushed
+            _entry = self.__load_index().get(package_name)
+            _latest: Optional[Dict] = None
+            _unindexed = 0
+
+            for package in self.__paginate(
+                lambda client, offset, limit: torizon_cloud.PackagesApi(client).get_packages(
+                    offset=offset,
+                    limit=limit,
+                    name=package_name,
+                    sort_by=torizon_cloud.TargetItemsSort.CREATEDAT,
+                    sort_direction=torizon_cloud.SortDirection.DESC
+                )
+            ):
+                _created_at = package.created_at.timestamp() \
+                    if package.created_at is not None else None
+
+                if _entry is not None:
+                    if package.package_id == _entry["package_id"]:
+                        if _latest is None or _entry["version"] > _latest["version"]:
+                            _latest = _entry
+                        break
+
+                    # older than the indexed one, that was then deleted
+                    if _created_at is not None and \
+                        _entry["created_at"] is not None and \
+                        _created_at < _entry["created_at"]:
+
+                        _entry = None
+
+                if _latest is None or int(package.version) > _latest["version"]:
+                    _latest = {
+                        "version": int(package.version),
+                        "hash": package.hashes["sha256"],
+                        "package_id": package.package_id,
+                        "created_at": _created_at
+                    }
+
+                if _entry is None:
+                    _unindexed += 1
+
+                    if _unindexed == _PAGE_SIZE:
+                        break
+
+            if _latest != self.__load_index().get(package_name):
+                self.__update_index(package_name, _latest)
+
+        if _latest is None:
+            return {
+                "hash": None,
+                "version": 0,
+                "package_id": None
+            }
+
+        return {
+            "hash": _latest["hash"],
+            "version": _latest["version"],
+            "package_id": _latest["package_id"]
+        }
+
+
+    def package_latest_hash(self, package_name: str) -> str:
+        _hash = self.package_latest(package_name)["hash"]
+
+        if _hash is None:
+            raise ReferenceError(f"Package {package_name} not found")
+
+        return _hash
+
+
+    def package_latest_version(self, package_name: str) -> int:
+        return self.package_latest(package_name)["version"]
+
+
+    def __upload(
+            self,
+            package_name: str,
+            version: str,
+            path: str,
+            hardware_id: str,
+            progress: Optional[ProgressCallback]
+        ):
+        """
+        Stream the file [path] to the packages endpoint. The generated api
+        client only accepts the body in memory, so the request is done with
+        requests, that streams file like objects with a known length.
+        Connection errors and 5xx answers are retried, and a conflict after a
+        failed attempt is checked, the previous attempt may have been
+        stored before the connection dropped.
+        """
+        import requests
+        import torizon_io_api as torizon_cloud
+
+        _length = os.path.getsize(path)
+        _hash = sha256_file(path)
+        _client = self.__api_client()
+        _url = f"{self.__api_host}/packages"
+        _params = {
+            "name": package_name,
+            "version": version,
+            "hardwareId": hardware_id,
+            "targetFormat": "BINARY"
+        }
+
+        _attempt = 0
+        _refreshed = False
+
+        while True:
+            try:
+                with open(path, "rb") as file:
+                    _response = requests.post(
+                        _url,
+                        params=_params,
+                        headers={
+                            "Authorization": f"Bearer {_client.configuration.access_token}",
+                            "Content-Type": "application/octet-stream",
+                            "Content-Length": str(_length)
+                        },
+                        data=_UploadReader(file, _length, progress)
+                    )
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                _response = None
+                _error = str(ex)
+
+            if _response is not None:
+                if _response.status_code == 401 and not _refreshed:
+                    _refreshed = True
+                    with self.__lock:
+                        _client.configuration.access_token = self.__token(refresh=True)
+                    continue
+
+                if _response.status_code == 409 and _attempt > 0:
+                    _stored = self.__call(
+                        lambda client: torizon_cloud.PackagesApi(client).get_packages(
+                            limit=1,
+                            name=package_name,
+                            version=version
+                        )
+                    )
+
+                    if _stored.values and _stored.values[0].hashes["sha256"] == _hash:
+                        return _stored.values[0]
+
+                if _response.status_code < 500 and _response.status_code != 429:
+                    _response.raise_for_status()
+
+                    _package = torizon_cloud.Package.from_dict(_response.json())
+
+                    if _package.hashes["sha256"] != _hash:
+                        raise RuntimeError(
+                            f"Package {package_name} {version} uploaded with wrong sha256"
+                        )
+
+                    return _package
+
+                _error = f"HTTP {_response.status_code}"
+
+            if _attempt == _UPLOAD_RETRIES:
+                raise RuntimeError(
+                    f"Upload of {path} failed after {_attempt +1} attempts: {_error}"
+                )
+
+            time.sleep(2 ** _attempt)
+            _attempt += 1
+
+
+    def package_new(
+            self,
+            package_name: str,
+            docker_compose_path: str,
+            progress: Optional[ProgressCallback] = None
+        ) -> str:
+        """
+        Push the [docker_compose_path] as a new version of the package
+        [package_name]. Returns the sha256 of the pushed package.
+        The file is streamed, so big files are not loaded to memory, and
+        progress is called as it is sent.
+        """
+        if not os.path.exists(docker_compose_path):
+            raise ReferenceError(f"File {docker_compose_path} not found")
+
+        # get the latest version and increment it
+        _ver = self.package_latest_version(package_name) + 1
+
+        # push it
+        _ret = self.__upload(
+            package_name,
+            str(_ver),
+            docker_compose_path,
+            "docker-compose",
+            progress
+        )
+
+        with self.__index_lock:
+            self.__update_index(package_name, {
+                "version": _ver,
+                "hash": _ret.hashes["sha256"],
+                "package_id": _ret.package_id,
+                "created_at": _ret.created_at.timestamp() \
+                    if _ret.created_at is not None else None
+            })
+
+        return _ret.hashes["sha256"]
+
+
+    def update_fleet_latest(self, package_name: str, fleet_name: str) -> int:
+        """
+        Update the fleet [fleet_name] to the latest version of the package
+        [package_name]. Returns the number of affected devices.
+        """
+        _ret = self.update_fleets([package_name], [fleet_name])[fleet_name]
+
+        if isinstance(_ret, Exception):
+            raise _ret
+
+        return _ret
+
+
+    def update_fleets(
+            self,
+            package_names: List[str],
+            fleet_names: List[str],
+            max_parallel: int = 4
+        ) -> Dict:
+        """
+        Update each fleet of [fleet_names] to the latest version of all the
+        packages of [package_names]. The packages and fleets are resolved
+        once, before any update is requested, and then one update per fleet
+        is requested, at most [max_parallel] at same time.
+        Returns for each fleet the number of affected devices, or the
+        exception raised by its update request.
+        """
+        import torizon_io_api as torizon_cloud
+        from concurrent.futures import ThreadPoolExecutor
+
+        _package_ids = []
+
+        for package_name in package_names:
+            _package_id = self.package_latest(package_name)["package_id"]
+
+            if _package_id is None:
+                raise ReferenceError(f"Package {package_name} not found")
+
+            _package_ids.append(_package_id)
+
+        _fleet_ids = self.get_fleet_ids(fleet_names)
+
+        def _update(fleet_name: str) -> int:
+            _update_rq = torizon_cloud.UpdateRequest()
+            _update_rq.package_ids = _package_ids
+            _update_rq.fleets = [
+                _fleet_ids[fleet_name]
+            ]
+
+            _ret = self.__call(
+                lambda client: torizon_cloud.UpdatesApi(client).post_updates(
+                    update_request=_update_rq
+                )
+            )
+
+            return len(_ret.affected or [])
+
+        _results: Dict = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as pool:
+            _futures = {
+                fleet_name: pool.submit(_update, fleet_name)
+                for fleet_name in fleet_names
+            }
+
+            for fleet_name, future in _futures.items():
+                try:
+                    _results[fleet_name] = future.result()
+                except Exception as ex:
+                    _results[fleet_name] = ex
+
+        return _results
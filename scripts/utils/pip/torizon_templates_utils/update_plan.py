@@ -0,0 +1,235 @@
+
+import os
+import json
+import shutil
+import hashlib
+from typing import Dict, List, Optional
+from torizon_templates_utils.hashing import FileHashCache
+from torizon_templates_utils.placeholders import PlaceholderReplacer
+from torizon_templates_utils.template_cache import templates_commit
+
+# bump it when the manifest format changes
+_MANIFEST_VERSION = 1
+_PROJECT_CACHE = ".conf/.cache/updater-hashes.json"
+
+UNCHANGED = "unchanged"
+CHANGED = "changed"
+NEW = "new"
+
+
+def _cache_dir() -> str:
+    _cache_home = os.environ.get(
+        "XDG_CACHE_HOME",
+        os.path.join(os.path.expanduser("~"), ".cache")
+    )
+
+    return os.path.join(_cache_home, "torizon-templates")
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, data: Dict) -> None:
+    # the caches are only an optimization, read only folders are fine
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _tmp_path = f"{path}.{os.getpid()}.tmp"
+
+        with open(_tmp_path, 'w') as file:
+            json.dump(data, file)
+
+        os.replace(_tmp_path, path)
+    except OSError:
+        pass
+
+
+class PlanEntry:
+    """
+    A file of the project that the update can change. The new content comes
+    from the [source] file of the templates repository, or is the
+    [content] generated by the updater. With [render] the placeholders are
+    replaced on the new content. With [merge] the user merges the changes,
+    otherwise the new content is always accepted, and with [merge_new] the
+    user also merges the files that do not exist on the project yet.
+    """
+
+    def __init__(
+            self,
+            target: str,
+            source: Optional[str] = None,
+            content: Optional[str] = None,
+            render: bool = True,
+            merge: bool = True,
+            merge_new: bool = True
+        ):
+        self.target = target
+        self.source = source
+        self.content = content
+        self.render = render
+        self.merge = merge
+        self.merge_new = merge_new
+        self.status: Optional[str] = None
+
+
+class UpdatePlanner:
+    """
+    UpdatePlanner compares the files that the update would write with the
+    ones of the project, without copying anything. The hashes of the
+    templates repository files are kept on a manifest per repository
+    commit, shared by all the projects, and the hashes of the project files
+    on .conf/.cache, both checked by mtime and size. So after the first
+    plan only the touched files, and the template files with placeholders,
+    are read again.
+    """
+
+    def __init__(
+            self,
+            templates_root: str,
+            project_folder: str,
+            replacer: PlaceholderReplacer
+        ):
+        self.__project_folder = project_folder
+        self.__replacer = replacer
+
+        _templates_root = os.path.realpath(templates_root)
+        _key = hashlib.sha256(json.dumps([
+            _MANIFEST_VERSION,
+            templates_commit(_templates_root),
+            _templates_root,
+            replacer.placeholders()
+        ]).encode()).hexdigest()
+
+        self.__manifest_path = os.path.join(
+            _cache_dir(), f"update-manifest-{_key[:16]}.json"
+        )
+        self.__project_cache_path = os.path.join(project_folder, _PROJECT_CACHE)
+
+        _manifest = _read_json(self.__manifest_path)
+
+        if _manifest is None or _manifest.get("version") != _MANIFEST_VERSION:
+            _manifest = { "version": _MANIFEST_VERSION, "files": {}, "placeholders": {} }
+
+        # source -> [sha256, has placeholders]
+        self.__placeholders: Dict[str, List] = _manifest["placeholders"]
+        self.__template_hashes = FileHashCache(_manifest["files"])
+
+        _project_cache = _read_json(self.__project_cache_path)
+        self.__project_hashes = FileHashCache(
+            _project_cache if _project_cache is not None else None
+        )
+
+
+    def __read_text(self, path: str) -> Optional[str]:
+        try:
+            with open(path, 'r', encoding="utf-8", newline="") as file:
+                return file.read()
+        except UnicodeDecodeError:
+            return None
+
+
+    def __has_placeholders(self, source: str, sha: str) -> bool:
+        _entry = self.__placeholders.get(source)
+
+        if _entry is not None and _entry[0] == sha:
+            return _entry[1]
+
+        _content = self.__read_text(source)
+        _has = _content is not None and self.__replacer.contains(_content)
+        self.__placeholders[source] = [sha, _has]
+
+        return _has
+
+
+    def rendered(self, entry: PlanEntry) -> Optional[str]:
+        """
+        The new content of [entry] with the placeholders replaced, or None
+        if it is the [entry] source file as it is.
+        """
+        if entry.content is not None:
+            if entry.render:
+                return self.__replacer.replace(entry.content)
+
+            return entry.content
+
+        if not entry.render:
+            return None
+
+        _sha = self.__template_hashes.hash_file(entry.source)
+
+        if not self.__has_placeholders(entry.source, _sha):
+            return None
+
+        return self.__replacer.replace(self.__read_text(entry.source))
+
+
+    def __new_hash(self, entry: PlanEntry) -> str:
+        _content = self.rendered(entry)
+
+        if _content is None:
+            return self.__template_hashes.hash_file(entry.source)
+
+        return hashlib.sha256(_content.encode("utf-8")).hexdigest()
+
+
+    def plan(self, entries: List[PlanEntry]) -> List[PlanEntry]:
+        """
+        Set the status of each of the [entries], UNCHANGED, CHANGED or NEW
+        on the project. Returns the [entries].
+        """
+        _targets = [
+            os.path.join(self.__project_folder, entry.target)
+            for entry in entries
+        ]
+
+        # all the hashes in parallel, the cached ones are not read
+        self.__template_hashes.hash_files([
+            entry.source for entry in entries if entry.content is None
+        ])
+        self.__project_hashes.hash_files([
+            target for target in _targets if os.path.isfile(target)
+        ])
+
+        for entry, target in zip(entries, _targets):
+            if not os.path.isfile(target):
+                entry.status = NEW
+            elif self.__new_hash(entry) == self.__project_hashes.hash_file(target):
+                entry.status = UNCHANGED
+            else:
+                entry.status = CHANGED
+
+        self.__save()
+
+        return entries
+
+
+    def write(self, entry: PlanEntry, path: str) -> None:
+        """
+        Write the new content of [entry] to [path].
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _content = self.rendered(entry)
+
+        if _content is None:
+            _exists = os.path.exists(path)
+            shutil.copyfile(entry.source, path)
+
+            # same as cp, new files get the mode of the source
+            if not _exists:
+                shutil.copymode(entry.source, path)
+        else:
+            with open(path, 'w', encoding="utf-8", newline="") as file:
+                file.write(_content)
+
+
+    def __save(self) -> None:
+        _write_json(self.__manifest_path, {
+            "version": _MANIFEST_VERSION,
+            "files": self.__template_hashes.entries(),
+            "placeholders": self.__placeholders
+        })
+        _write_json(self.__project_cache_path, self.__project_hashes.entries())